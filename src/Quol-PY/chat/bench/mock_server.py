@@ -0,0 +1,309 @@
+"""
+Local stand-in for the Gemini, Groq and Ollama chat APIs.
+
+    python bench/mock_server.py --port 8765 --latency 300 --token-rate 80 --fail-rate 0.05
+
+Point the chat config at it with
+    gemini.url  = http://127.0.0.1:8765/v1beta
+    groq.url    = http://127.0.0.1:8765/openai/v1
+    ollama.host = http://127.0.0.1:8765
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+WORDS = (
+    'the screen shows a settings dialog with several options that control how the application '
+    'behaves when it starts and which files it opens by default you can change them here'
+).split()
+
+CODE = ['\n\n```python\n', 'def', ' main', '():\n', '    print', '(', '"hello"', ')\n', '```\n\n']
+
+
+class MockConfig:
+    def __init__(self, latency_ms=200, token_rate=100, tokens=200, chunk_tokens=4,
+                 fail_rate=0.0, rate_limit_rate=0.0, retry_after=1.0, seed=None):
+        self.latency_ms = latency_ms
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.chunk_tokens = chunk_tokens
+        self.fail_rate = fail_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+    def response_tokens(self):
+        # mostly prose with one fenced block, so the markdown and highlighting paths are exercised too
+        tokens = [' ' + self.random.choice(WORDS) for _ in range(max(0, self.tokens - len(CODE)))]
+        middle = len(tokens) // 2
+        return tokens[:middle] + CODE[:self.tokens] + tokens[middle:]
+
+    def chunks(self):
+        tokens = self.response_tokens()
+        for i in range(0, len(tokens), self.chunk_tokens):
+            yield ''.join(tokens[i:i + self.chunk_tokens]), len(tokens[i:i + self.chunk_tokens])
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/api/ps':
+            self.send_json({'models': [{'name': m, 'model': m, 'size': 0, 'size_vram': 0} for m in self.server.loaded]})
+        elif path == '/api/tags':
+            self.send_json({'models': []})
+        else:
+            self.send_json({'error': {'message': f'Unknown path {path}', 'code': 404}}, 404)
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests += 1
+        self.server.upload_bytes += len(body)
+
+        try:
+            data = json.loads(body or b'{}')
+        except ValueError:
+            self.send_json({'error': {'message': 'Invalid JSON', 'code': 400}}, 400)
+            return
+
+        if path.endswith(':streamGenerateContent'):
+            self.gemini(stream=True)
+        elif path.endswith(':generateContent'):
+            self.gemini(stream=False)
+        elif path.endswith('/chat/completions'):
+            self.groq(data.get('model', ''), stream=data.get('stream', False))
+        elif path == '/api/chat':
+            self.ollama(data.get('model', ''), stream=data.get('stream', True))
+        elif path == '/api/generate':
+            self.server.loaded.add(self.ollama_name(data.get('model', '')))
+            self.send_json({'model': data.get('model', ''), 'response': '', 'done': True})
+        else:
+            self.send_json({'error': {'message': f'Unknown path {path}', 'code': 404}}, 404)
+
+    def inject_failure(self, ollama=False):
+        roll = self.config.random.random()
+        if roll < self.config.rate_limit_rate:
+            self.server.rate_limited += 1
+            message = 'Mock rate limit'
+            error = message if ollama else {'message': message, 'code': 429}
+            self.send_json({'error': error}, 429, {'Retry-After': str(self.config.retry_after)})
+            return True
+        if roll < self.config.rate_limit_rate + self.config.fail_rate:
+            self.server.failed += 1
+            message = 'Mock failure'
+            error = message if ollama else {'message': message, 'code': 500}
+            self.send_json({'error': error}, 500)
+            return True
+        return False
+
+    def wait_first_byte(self):
+        time.sleep(self.config.latency_ms / 1000)
+
+    def pace(self, count):
+        if self.config.token_rate:
+            time.sleep(count / self.config.token_rate)
+
+    def gemini(self, stream):
+        self.wait_first_byte()
+        if self.inject_failure():
+            return
+
+        if not stream:
+            text = ''.join(self.config.response_tokens())
+            self.pace(self.config.tokens)
+            self.send_json({
+                'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}}],
+                'usageMetadata': {'candidatesTokenCount': self.config.tokens},
+            })
+            return
+
+        self.start_chunked('text/event-stream')
+        sent = 0
+        for text, count in self.config.chunks():
+            self.pace(count)
+            sent += count
+            event = {
+                'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}}],
+                'usageMetadata': {'candidatesTokenCount': sent},
+            }
+            self.write_chunk(f'data: {json.dumps(event)}\r\n\r\n')
+        self.end_chunked()
+
+    def groq(self, model, stream):
+        self.wait_first_byte()
+        if self.inject_failure():
+            return
+
+        if not stream:
+            text = ''.join(self.config.response_tokens())
+            self.pace(self.config.tokens)
+            self.send_json({
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                'usage': {'completion_tokens': self.config.tokens},
+            })
+            return
+
+        self.start_chunked('text/event-stream')
+        for text, count in self.config.chunks():
+            self.pace(count)
+            event = {'model': model, 'choices': [{'index': 0, 'delta': {'content': text}}]}
+            self.write_chunk(f'data: {json.dumps(event)}\n\n')
+
+        event = {
+            'model': model,
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+            'x_groq': {'usage': {'completion_tokens': self.config.tokens}},
+        }
+        self.write_chunk(f'data: {json.dumps(event)}\n\n')
+        self.write_chunk('data: [DONE]\n\n')
+        self.end_chunked()
+
+    @staticmethod
+    def ollama_name(model):
+        return model if ':' in model else f'{model}:latest'
+
+    def ollama(self, model, stream):
+        self.wait_first_byte()
+        if self.inject_failure(ollama=True):
+            return
+        self.server.loaded.add(self.ollama_name(model))
+
+        done = {
+            'model': model,
+            'message': {'role': 'assistant', 'content': ''},
+            'done': True,
+            'done_reason': 'stop',
+            'eval_count': self.config.tokens,
+        }
+        if not stream:
+            self.pace(self.config.tokens)
+            done['message']['content'] = ''.join(self.config.response_tokens())
+            self.send_json(done)
+            return
+
+        self.start_chunked('application/x-ndjson')
+        for text, count in self.config.chunks():
+            self.pace(count)
+            event = {'model': model, 'message': {'role': 'assistant', 'content': text}, 'done': False}
+            self.write_chunk(json.dumps(event) + '\n')
+        self.write_chunk(json.dumps(done) + '\n')
+        self.end_chunked()
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def end_chunked(self):
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        super().__init__((host, port), MockHandler)
+        self.config = config or MockConfig()
+        self.loaded = set()
+        self.requests = 0
+        self.upload_bytes = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.thread = None
+
+    def handle_error(self, request, client_address):
+        # cancelled requests close the connection mid-stream, which is expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def add_mock_arguments(parser):
+    parser.add_argument('--latency', type=float, default=200, help='ms before the first byte')
+    parser.add_argument('--token-rate', type=float, default=100, help='tokens per second, 0 for no pacing')
+    parser.add_argument('--tokens', type=int, default=200, help='tokens per response')
+    parser.add_argument('--chunk-tokens', type=int, default=4, help='tokens per streamed chunk')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of requests answered with a 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='fraction of requests answered with a 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with a 429')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def mock_config(args):
+    return MockConfig(
+        latency_ms=args.latency,
+        token_rate=args.token_rate,
+        tokens=args.tokens,
+        chunk_tokens=args.chunk_tokens,
+        fail_rate=args.fail_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline stand-in for the chat provider APIs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockServer(mock_config(args), args.host, args.port)
+    print(f'Mock providers on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
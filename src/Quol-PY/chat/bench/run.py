@@ -0,0 +1,326 @@
+"""
+Headless benchmark of the chat path against the local mock providers.
+
+    python bench/run.py --providers groq gemini ollama --runs 10 --latency 300 --token-rate 80
+    python bench/run.py --save base.json
+    python bench/run.py --compare base.json --tolerance 0.2
+
+Run from the chat tool folder with qlib importable. The tool is copied to a temp folder so the
+benchmark never touches the real config, logs, cache or conversation database.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+TOOL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOOL_DIR)
+
+import ollama
+from PySide6.QtCore import QEventLoop, QObject, QPointF, QTimer, Signal
+from PySide6.QtGui import QColor, QImage, QLinearGradient, QPainter
+from PySide6.QtWidgets import QApplication
+
+from mock_server import MockServer, add_mock_arguments, mock_config
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PROVIDERS = ('groq', 'gemini', 'ollama', 'fanout', 'auto')
+COMPARED = (('ttft_ms', 'p50'), ('first_render_ms', 'p50'), ('total_ms', 'p50'), ('render_ms', 'p50'), ('render_ms', 'p90'))
+
+
+class BenchSpec(QObject):
+    toggle_signal = Signal(bool)
+    toggle_instant_signal = Signal(bool)
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+
+class Probe:
+    """Times one prompt through the same window methods the real UI goes through."""
+
+    def __init__(self, window):
+        self.window = window
+        self.reset()
+
+        chat_window = window.chat_window
+        append_output = chat_window.append_output
+        set_output = chat_window.set_output
+        set_loading = window.set_button_loading_state
+        record_metrics = window.ai.record_metrics
+
+        def on_append(*args, **kwargs):
+            if self.ttft is None:
+                self.ttft = self.elapsed()
+            append_output(*args, **kwargs)
+
+        def on_set_output(*args, **kwargs):
+            started = time.perf_counter()
+            set_output(*args, **kwargs)
+            # loading text before the first delta is not counted, the final render without arguments always is
+            if self.ttft is not None or not (args or kwargs):
+                self.renders.append((time.perf_counter() - started) * 1000)
+                if self.first_render is None:
+                    self.first_render = self.elapsed()
+
+        def on_loading(is_loading):
+            set_loading(is_loading)
+            if not is_loading and self.loop:
+                self.total = self.elapsed()
+                self.loop.quit()
+
+        def on_metrics(provider, model, job, status, text=''):
+            self.status = status
+            record_metrics(provider, model, job, status, text)
+
+        chat_window.append_output = on_append
+        chat_window.set_output = on_set_output
+        window.set_button_loading_state = on_loading
+        window.ai.record_metrics = on_metrics
+
+    def reset(self):
+        self.started = 0
+        self.ttft = None
+        self.first_render = None
+        self.total = None
+        self.renders = []
+        self.status = None
+        self.loop = None
+
+    def elapsed(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def run(self, provider, data, timeout):
+        self.reset()
+        self.loop = QEventLoop()
+        QTimer.singleShot(int(timeout * 1000), self.loop.quit)
+
+        self.started = time.perf_counter()
+        self.window.ai.prompt(provider, data)
+        if self.total is None:
+            self.loop.exec()
+        self.loop = None
+
+        if self.total is None:
+            self.window.ai.stop()
+            self.status = 'timeout'
+        return {
+            'status': self.status or 'error',
+            'ttft_ms': self.ttft,
+            'first_render_ms': self.first_render,
+            'total_ms': self.total,
+            'renders': self.renders,
+        }
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def configure(config, server):
+    config['gemini']['url'] = f'{server.url}/v1beta'
+    config['groq']['url'] = f'{server.url}/openai/v1'
+    config['ollama']['host'] = server.url
+    config['ollama']['warmup'] = 'off'
+    for provider in ('gemini', 'groq'):
+        config[provider]['apikey'] = config[provider]['apikey'] or 'bench'
+    config['cache']['enabled'] = False
+    config['image']['speculative'] = False
+
+
+def prepare_tool(server):
+    work = tempfile.mkdtemp(prefix='quol-chat-bench-')
+    path = os.path.join(work, 'chat')
+    shutil.copytree(
+        TOOL_DIR, path,
+        ignore=shutil.ignore_patterns('bench', 'logs', 'cache', 'profile', 'chat.db*', '__pycache__'),
+    )
+    with open(os.path.join(path, 'test_response.txt'), 'w') as f:
+        f.write('')
+
+    with open(os.path.join(path, 'res', 'config.json'), 'r') as f:
+        config = json.load(f)
+    configure(config, server)
+    with open(os.path.join(path, 'res', 'config.json'), 'w') as f:
+        json.dump(config, f, indent=2)
+
+    return work, path
+
+
+def synthetic_image(size):
+    width, height = (int(v) for v in size.lower().split('x'))
+    image = QImage(width, height, QImage.Format.Format_RGB32)
+
+    gradient = QLinearGradient(QPointF(0, 0), QPointF(width, height))
+    gradient.setColorAt(0, QColor(30, 30, 40))
+    gradient.setColorAt(1, QColor(200, 210, 230))
+    painter = QPainter(image)
+    painter.fillRect(image.rect(), gradient)
+    painter.setPen(QColor(20, 20, 20))
+    for y in range(20, height, 24):
+        painter.drawText(10, y, 'The quick brown fox jumps over the lazy dog 0123456789 ' * 4)
+    painter.end()
+    return image
+
+
+def prompt_data(window, provider, text):
+    config = window.config
+    data = {'prompt': text, 'model': provider, 'image': window.image_data}
+    if provider == 'fanout':
+        data['providers'] = config['fanout']['providers']
+        data['mode'] = config['fanout']['mode']
+    elif provider in ('groq', 'gemini', 'ollama'):
+        data['model'] = config[provider]['model']
+        data['apikey'] = config[provider].get('apikey')
+    return data
+
+
+def summarize(runs, memory):
+    ok = [r for r in runs if r['status'] == 'ok']
+    result = {'runs': len(runs), 'errors': len(runs) - len(ok), 'chunks': percentile([len(r['renders']) for r in ok], 50)}
+    for field in ('ttft_ms', 'first_render_ms', 'total_ms'):
+        values = [r[field] for r in ok if r[field] is not None]
+        result[field] = {'p50': percentile(values, 50), 'p90': percentile(values, 90)}
+    renders = [ms for r in ok for ms in r['renders']]
+    result['render_ms'] = {'p50': percentile(renders, 50), 'p90': percentile(renders, 90), 'max': max(renders, default=None)}
+    result.update(memory)
+    return result
+
+
+def fmt(value, unit=''):
+    return '-' if value is None else f'{value:.1f}{unit}'
+
+
+def print_report(results):
+    print(
+        f'{"provider":<8} {"runs":>4} {"err":>3} {"ttft p50":>9} {"ttft p90":>9} {"paint p50":>9} '
+        f'{"total p50":>10} {"chunks":>6} {"render p50":>10} {"render p90":>10} {"render max":>10} {"py peak":>8} {"rss":>8}'
+    )
+    for provider, r in results.items():
+        print(
+            f'{provider:<8} {r["runs"]:>4} {r["errors"]:>3} {fmt(r["ttft_ms"]["p50"]):>9} {fmt(r["ttft_ms"]["p90"]):>9} '
+            f'{fmt(r["first_render_ms"]["p50"]):>9} {fmt(r["total_ms"]["p50"]):>10} {fmt(r["chunks"]):>6} '
+            f'{fmt(r["render_ms"]["p50"]):>10} {fmt(r["render_ms"]["p90"]):>10} {fmt(r["render_ms"]["max"]):>10} '
+            f'{fmt(r["python_peak_mb"], "M"):>8} {fmt(r["rss_mb"], "M"):>8}'
+        )
+
+
+def compare(results, path, tolerance):
+    with open(path, 'r') as f:
+        baseline = json.load(f)['results']
+
+    regressions = []
+    for provider, r in results.items():
+        if provider not in baseline:
+            continue
+        for field, p in COMPARED:
+            old, new = baseline[provider][field][p], r[field][p]
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f'{provider} {field} {p}: {old:.1f} -> {new:.1f} ms (+{(new / old - 1) * 100:.0f}%)')
+
+    for line in regressions:
+        print('Regression:', line)
+    if not regressions:
+        print(f'No regressions against {path}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless chat benchmark against the mock providers')
+    parser.add_argument('--providers', nargs='+', default=['groq', 'gemini', 'ollama'], choices=PROVIDERS)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1, help='untimed runs per provider')
+    parser.add_argument('--prompt', default='Explain what is on the screen')
+    parser.add_argument('--image', default=None, help='attach a synthetic screenshot, e.g. 1920x1080')
+    parser.add_argument('--no-stream', action='store_true')
+    parser.add_argument('--no-history', action='store_true')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds before a run counts as timed out')
+    parser.add_argument('--trace-memory', action='store_true', help='track python allocation peaks (slows rendering)')
+    parser.add_argument('--save', default=None, help='write the results as JSON')
+    parser.add_argument('--compare', default=None, help='baseline JSON to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockServer(mock_config(args)).start()
+    work, path = prepare_tool(server)
+
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    import window as chat
+
+    main_window = chat.MainWindow(BenchSpec(path))
+    configure(main_window.config, server)
+    main_window.ai.ollama_client = ollama.Client(host=server.url)
+    main_window.ai.is_stream = not args.no_stream
+    main_window.ai.is_hist = not args.no_history
+    main_window.ai.is_img = bool(args.image)
+    image = synthetic_image(args.image) if args.image else None
+
+    probe = Probe(main_window)
+    results = {}
+    try:
+        for provider in args.providers:
+            main_window.ai.new_conversation()
+            main_window.ai_list.setCurrentText(provider)
+            main_window.image_data = None
+            if image is not None:
+                main_window.set_image(image)
+
+            for _ in range(args.warmup):
+                probe.run(provider, prompt_data(main_window, provider, args.prompt), args.timeout)
+
+            if args.trace_memory:
+                tracemalloc.start()
+            runs = [probe.run(provider, prompt_data(main_window, provider, args.prompt), args.timeout) for _ in range(args.runs)]
+
+            memory = {'python_peak_mb': None, 'rss_mb': max_rss_mb()}
+            if args.trace_memory:
+                memory['python_peak_mb'] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                tracemalloc.stop()
+            results[provider] = summarize(runs, memory)
+    finally:
+        main_window.close()
+        app.processEvents()
+        server.stop()
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(
+        f'mock: latency {args.latency:.0f} ms, {args.token_rate:.0f} tok/s, {args.tokens} tokens, '
+        f'{args.chunk_tokens} per chunk, fail {args.fail_rate:.0%}, 429 {args.rate_limit_rate:.0%}; '
+        f'{server.requests} requests, {server.upload_bytes / 1024:.0f} KB uploaded'
+    )
+    print_report(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
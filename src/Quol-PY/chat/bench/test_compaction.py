@@ -0,0 +1,81 @@
+"""
+History compaction against the local mock providers.
+
+    python -m unittest discover -s bench
+
+Run from the chat tool folder with qlib importable, like bench/run.py.
+"""
+
+import shutil
+import unittest
+
+from PySide6.QtCore import QEventLoop, QTimer
+from PySide6.QtWidgets import QApplication
+
+from mock_server import MockConfig, MockServer
+from run import BenchSpec, Probe, configure, prepare_tool, prompt_data
+
+
+def wait(ms):
+    loop = QEventLoop()
+    QTimer.singleShot(ms, loop.quit)
+    loop.exec()
+
+
+class FanoutCompactionTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer(MockConfig(latency_ms=10, token_rate=0, tokens=120, seed=1)).start()
+        self.work, path = prepare_tool(self.server)
+        self.app = QApplication.instance() or QApplication([])
+
+        import window as chat
+
+        self.window = chat.MainWindow(BenchSpec(path))
+        configure(self.window.config, self.server)
+        self.window.ai.is_img = False
+        self.window.ai.new_conversation()
+        self.window.ai_list.setCurrentText('fanout')
+
+        config = self.window.config
+        config['fanout']['providers'] = ['groq', 'gemini']
+        config['groq']['context_tokens'] = 1000
+        config['compaction']['context_tokens'] = 1000
+        config['compaction']['summarizer'] = 'same'
+        self.probe = Probe(self.window)
+
+    def tearDown(self):
+        self.window.close()
+        self.app.processEvents()
+        self.server.stop()
+        shutil.rmtree(self.work, ignore_errors=True)
+
+    def run_rounds(self, mode, rounds=6):
+        self.window.config['fanout']['mode'] = mode
+        for i in range(rounds):
+            result = self.probe.run('fanout', prompt_data(self.window, 'fanout', f'question {i}'), timeout=10)
+            self.assertIsNotNone(result['total_ms'], f'{mode} round {i} never left the loading state')
+
+        compactor = self.window.ai.compactor
+        for _ in range(50):
+            if compactor.job is None:
+                break
+            wait(100)
+        return compactor
+
+    def assert_compacted(self, compactor):
+        # the kept turns can still be over budget on their own, fit() trims what is actually sent
+        self.assertTrue(compactor.summary)
+        self.assertLess(len(self.window.ai.history), 12)
+        self.assertLessEqual(compactor.history_tokens(compactor.fit('groq', 'next')), compactor.budget('groq'))
+
+    def test_side_by_side_over_budget(self):
+        compactor = self.run_rounds('side')
+        self.assert_compacted(compactor)
+
+    def test_first_answer_over_budget(self):
+        compactor = self.run_rounds('first')
+        self.assert_compacted(compactor)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,95 +1,494 @@
-import asyncio
-import base64
-import datetime
+import time
 
-import httpx
 from PySide6.QtCore import QTimer, QThread, Signal
 import ollama
 
+from lib.chat_log import ChatLogWriter
+from lib.compaction import HistoryCompactor, estimate_tokens
+from lib.metrics import MetricsRecorder
+from lib.network import NetworkWorker, RequestJob
+from lib.response_cache import ResponseCache
+from lib.router import rank_providers
+from lib.scheduler import RequestScheduler
+from lib.store import ConversationStore
+
+SAME_SCREEN_NOTE = '(The screen has not changed since the screenshot attached earlier.)'
+
 
 class AI:
     def __init__(self, main_window: 'MainWindow', chat_window: 'ChatWindow'):
         self.main_window = main_window
         self.chat_window = chat_window
         self.current_type = None
+        self.current_model = None
+        self.request_start = 0
 
         self.is_img = True
         self.is_hist = True
+        self.is_stream = True
         self.text_content = ''
         self.loading_counter = 0
+        self.loading_label = ''
+        self.loading_info = ''
+        self.loading_timer = QTimer()
+        self.loading_timer.timeout.connect(self.on_loading)
 
         self.max_hist = self.main_window.config['config']['max_history']
         self.history = []
+        self.images = {}
+        self.compactor = HistoryCompactor(self)
+
+        self.network = NetworkWorker()
+        self.network.start()
+        self.scheduler = RequestScheduler(self.main_window.config, self.launch_job)
+        self.job = None
+        self.fanout_jobs = {}
+        self.auto_jobs = []
+        self.auto_errors = []
+        self.auto_provider = ''
+        self.auto_prompt = ''
+        self.deadline_timer = QTimer()
+        self.deadline_timer.setSingleShot(True)
+        self.deadline_timer.timeout.connect(self.on_auto_deadline)
+
+        # one client for every local request so the connection to the Ollama server is reused
+        ollama_config = self.main_window.config['ollama']
+        self.ollama_client = ollama.Client(host=ollama_config['host'])
+        self.ollama_status = ''
+        self.ollama_checked = 0
+        self.warmup_thread = None
+        if ollama_config['warmup'] == 'start':
+            QTimer.singleShot(0, self.warm_ollama)
+
+        log_config = self.main_window.config['log']
+        self.log_writer = ChatLogWriter(
+            self.main_window.tool_spec.path + '/res/logs',
+            fmt=log_config['format'],
+            max_bytes=log_config['max_bytes'],
+            rotate_daily=log_config['rotate_daily'],
+            keep=log_config['keep'],
+        )
+
+        self.metrics = MetricsRecorder(self.main_window.tool_spec.path + '/res/logs/metrics.jsonl')
+        self.timing = {}
+
+        store_config = self.main_window.config['store']
+        self.store = ConversationStore(
+            self.main_window.tool_spec.path + '/res/chat.db',
+            save_images=store_config['images'],
+            max_image_bytes=store_config['max_image_bytes'],
+            max_image_days=store_config['max_image_days'],
+        )
+        self.conversation_id = None
+
+        self.cache = None
+        self.cache_key = None
 
     def prompt(self, model, d):
+        # a new prompt replaces whatever is still running instead of racing it into the chat window
+        self.cancel()
         self.current_type = model
+        self.current_model = d['model']
+        self.request_start = time.perf_counter()
         self.chat_window.show()
+        self.chat_window.reset_stream()
         self.chat_window.set_output('<p>Loading...</p>')
         self.chat_window.scroll_to_bottom()
 
         if self.main_window.test_response:
             self.chat_window.chat_response.setHtml(self.main_window.test_response)
+            self.chat_window.invalidate()
             self.main_window.set_button_loading_state(False)
             return
 
+        image = d['image'] if self.is_img else None
+        self.loading_info = f' · {image.describe()}' if image else ''
+
+        if model == 'fanout':
+            self.fanout(d['prompt'], image, d['providers'], d['mode'])
+            return
+
+        self.cache_key = None
+        if model == 'auto':
+            self.auto(d['prompt'], image)
+            return
+
+        if self.main_window.config['cache']['enabled']:
+            history, summary = [], ''
+            if self.is_hist and model != 'ollama':
+                history, summary = self.compactor.fit(model, d['prompt'], image), self.compactor.summary
+            self.cache_key = ResponseCache.key(model, d['model'], d['prompt'], history, image, summary)
+            text = self.response_cache().get(self.cache_key)
+            if text is not None:
+                self.on_cache_hit(model, d['prompt'], image, text)
+                return
+
         if model == 'ollama':
             self.add_history('ollama', d['prompt'], None, True)
-            self.ollama(d['model'], d['prompt'])
+            self.ollama(d['model'], d['prompt'], image.data if image else None)
+            return
+
+        job = self.create_job(model, d['model'], d['prompt'], d['apikey'], image)
+        self.add_history(model, d['prompt'], image, True)
+        self.run_request_thread(model, d['prompt'], job)
+
+    def response_cache(self):
+        # only built once caching is turned on
+        if self.cache is None:
+            cache_config = self.main_window.config['cache']
+            self.cache = ResponseCache(
+                self.main_window.tool_spec.path + '/res/cache', ttl=cache_config['ttl'], max_bytes=cache_config['max_bytes']
+            )
+        return self.cache
+
+    def create_job(self, model_type, model, prompt, key=None, image=None, with_history=True):
+        if model_type == 'ollama':
+            return OllamaThread(
+                self.ollama_client, model, prompt, image.data if image else None, self.ollama_keep_alive()
+            )
+
+        history, summary = [], ''
+        if self.is_hist and with_history:
+            history, summary = self.compactor.fit(model_type, prompt, image), self.compactor.summary
+
+        if model_type == 'gemini':
+            url, headers, data = self.gemini(model, prompt, key, image, history, summary)
+        elif model_type == 'groq':
+            url, headers, data = self.groq(model, prompt, key, image, history, summary)
+        else:
+            raise Exception(f'Unknown model type: {model_type}')
+
+        return RequestJob(model_type, url, headers, data, stream=self.is_stream)
+
+    def start_job(self, job):
+        self.scheduler.submit(job)
+
+    def launch_job(self, job):
+        if isinstance(job, OllamaThread):
+            if job.isRunning():
+                job.wait()
+            job.start()
+        else:
+            self.network.submit(job)
+
+    def cancel_job(self, job):
+        self.scheduler.cancel(job)
+
+    def cancel(self):
+        jobs = list(self.fanout_jobs.values())
+        if self.job is not None:
+            jobs.append(self.job)
+
+        jobs += [job for _, job in self.auto_jobs]
+
+        for job in jobs:
+            self.cancel_job(job)
+        self.job = None
+        self.fanout_jobs = {}
+        self.auto_jobs = []
+        self.loading_timer.stop()
+        self.deadline_timer.stop()
+        return bool(jobs)
 
-        elif model == 'gemini':
-            url, headers, data = self.gemini(d['model'], d['prompt'], d['apikey'])
-            self.run_request_thread('gemini', d['prompt'], url, headers, data)
+    def stop(self):
+        if not self.cancel():
+            return
 
-        elif model == 'groq':
-            url, headers, data = self.groq(d['model'], d['prompt'], d['apikey'])
-            self.run_request_thread('groq', d['prompt'], url, headers, data)
+        self.chat_window.reset_stream()
+        self.chat_window.set_output('<p>Cancelled.</p>')
+        self.main_window.set_button_loading_state(False)
 
-    def run_request_thread(self, model_type, prompt, url, headers, data):
+    def start_loading(self, label='Loading...'):
         self.loading_counter = 0
+        self.loading_label = label
+        self.loading_timer.start(100)
 
-        def on_loading():
-            self.loading_counter += 0.1
-            self.chat_window.set_output(f'<p>Loading... ({self.loading_counter:.1f}s)</p>')
+    def on_loading(self):
+        self.loading_counter += 0.1
+        self.chat_window.set_output(f'<p>{self.loading_label} ({self.loading_counter:.1f}s){self.loading_info}</p>')
+
+    def on_rate_limited(self, job):
+        self.loading_label = f'Rate limited by {job.model_type}, retrying ({job.retries}/{job.max_retries})...'
+
+    def run_request_thread(self, model_type, prompt, job):
+        self.start_loading()
+
+        self.job = job
+        job.delta_signal.connect(lambda delta: self.on_request_delta(job, delta))
+        job.finished_signal.connect(lambda text: self.on_request_finished(job, model_type, prompt, text))
+        job.error_signal.connect(lambda error: self.on_request_error(job, model_type, error))
+        job.rate_limited_signal.connect(lambda _: job is self.job and self.on_rate_limited(job))
+
+        self.start_job(job)
+
+    def fanout(self, prompt, image, providers, mode):
+        config = self.main_window.config
+        self.fanout_jobs = {}
+        self.fanout_providers = providers
+        self.fanout_results = {}
+        self.fanout_errors = {}
+
+        for provider in providers:
+            try:
+                job = self.create_job(provider, config[provider]['model'], prompt, config[provider].get('apikey'), image)
+            except Exception as e:
+                self.fanout_errors[provider] = str(e)
+                continue
+            self.fanout_jobs[provider] = job
+
+        self.add_history('fanout', prompt, image, True)
+        self.start_loading(f'Waiting for {", ".join(self.fanout_jobs)}...')
+
+        for provider, job in self.fanout_jobs.items():
+            if mode == 'side':
+                job.delta_signal.connect(lambda delta, p=provider, j=job: self.on_fanout_delta(p, j, delta))
+            job.finished_signal.connect(lambda text, p=provider, j=job: self.on_fanout_finished(p, j, text, mode))
+            job.error_signal.connect(lambda error, p=provider, j=job: self.on_fanout_error(p, j, error, mode))
+            job.rate_limited_signal.connect(lambda _, j=job: self.on_rate_limited(j))
+            self.start_job(job)
+
+        if not self.fanout_jobs:
+            self.finish_fanout(mode)
+
+    def on_fanout_delta(self, provider, job, delta):
+        if job.cancelled:
+            return
+        self.loading_timer.stop()
+        self.chat_window.append_output(delta, provider)
 
-        self.loading_timer = QTimer()
-        self.loading_timer.timeout.connect(on_loading)
-        self.loading_timer.start(100)
+    def on_fanout_finished(self, provider, job, text, mode):
+        if job.cancelled or self.fanout_jobs.get(provider) is not job:
+            return
+
+        self.record_metrics(provider, self.main_window.config[provider]['model'], job, 'ok', text)
+        del self.fanout_jobs[provider]
+        self.fanout_results[provider] = text
+
+        if mode == 'first':
+            # first complete answer wins, the slower providers are cancelled
+            for other in self.fanout_jobs.values():
+                self.cancel_job(other)
+            self.fanout_jobs.clear()
+
+        if not self.fanout_jobs:
+            self.finish_fanout(mode)
+
+    def on_fanout_error(self, provider, job, error, mode):
+        if job.cancelled or self.fanout_jobs.get(provider) is not job:
+            return
+
+        self.record_metrics(provider, self.main_window.config[provider]['model'], job, 'error')
+        del self.fanout_jobs[provider]
+        self.fanout_errors[provider] = error
+        if mode == 'side':
+            self.chat_window.append_output(f'Error: {error}', provider)
+
+        if not self.fanout_jobs:
+            self.finish_fanout(mode)
+
+    def finish_fanout(self, mode):
+        self.loading_timer.stop()
+        self.chat_window.reset_stream()
+        results = self.fanout_results
+
+        if not results:
+            self.chat_window.set_output('<br>'.join(f'{p}: Error: {e}' for p, e in self.fanout_errors.items()))
+            self.main_window.set_button_loading_state(False)
+            return
+
+        if mode == 'first':
+            provider, text = next(iter(results.items()))
+            self.current_model = self.main_window.config[provider]['model']
+            self.text_content = text
+            self.add_history(provider, f'*{provider}*\n\n{text}', None, False)
+        else:
+            answers = dict(results)
+            answers.update({p: f'Error: {e}' for p, e in self.fanout_errors.items()})
+            self.text_content = '\n\n'.join(f'**{p}**\n\n{self.chat_window.close_fences(t)}' for p, t in answers.items())
+            self.add_history('fanout', self.text_content, None, False)
+
+        # every fanout provider is sent the same history
+        self.compact_history(*self.fanout_providers)
+        self.chat_window.set_output()
+        self.main_window.set_button_loading_state(False)
+
+    def auto(self, prompt, image):
+        config = self.main_window.config
+        exclude = ('ollama',) if self.ollama_status == 'offline' else ()
+        providers = rank_providers(self.metrics, config, image is not None, exclude)
+
+        # payloads are built before the prompt joins the history, so every fallback sends the same request
+        self.auto_jobs = []
+        self.auto_errors = []
+        for provider in providers:
+            try:
+                job = self.create_job(provider, config[provider]['model'], prompt, config[provider].get('apikey'), image)
+            except Exception as e:
+                self.auto_errors.append(f'{provider}: Error: {e}')
+                continue
+            self.auto_jobs.append((provider, job))
+
+        self.add_history('auto', prompt, image, True)
+        self.auto_next(prompt)
+
+    def auto_next(self, prompt):
+        # deltas from a provider that failed mid-stream must not end up in front of the next answer
+        self.chat_window.reset_stream()
+        if not self.auto_jobs:
+            self.loading_timer.stop()
+            self.chat_window.set_output('<br>'.join(self.auto_errors) or 'Error: no provider available')
+            self.main_window.set_button_loading_state(False)
+            return
+
+        provider, job = self.auto_jobs.pop(0)
+        self.current_type = provider
+        self.current_model = self.main_window.config[provider]['model']
+        self.auto_provider = provider
+        self.main_window.update_placeholder()
+
+        self.start_loading(f'Asking {provider}...')
+        self.job = job
+        job.delta_signal.connect(lambda delta: self.on_auto_delta(job, delta))
+        job.finished_signal.connect(lambda text: self.on_request_finished(job, provider, prompt, text))
+        job.error_signal.connect(lambda error: self.on_auto_error(job, provider, prompt, error))
+        job.rate_limited_signal.connect(lambda _: job is self.job and self.on_rate_limited(job))
+
+        self.auto_prompt = prompt
+        self.deadline_timer.start(self.main_window.config['auto']['deadline_ms'])
+        self.start_job(job)
+
+    def on_auto_delta(self, job, delta):
+        if job is self.job:
+            self.deadline_timer.stop()
+        self.on_request_delta(job, delta)
+
+    def on_auto_error(self, job, provider, prompt, error):
+        if job is not self.job:
+            return
+
+        self.deadline_timer.stop()
+        self.record_metrics(provider, self.current_model, job, 'error')
+        self.auto_errors.append(f'{provider}: Error: {error}')
+        self.auto_next(prompt)
+
+    def on_auto_deadline(self):
+        job, provider = self.job, self.current_type
+        if job is None:
+            return
+
+        # a provider that blows the deadline counts against it, so the next ranking moves away from it
+        self.record_metrics(provider, self.current_model, job, 'timeout')
+        self.cancel_job(job)
+        self.auto_errors.append(f'{provider}: no answer within {self.main_window.config["auto"]["deadline_ms"]} ms')
+        self.auto_next(self.auto_prompt)
+
+    def close(self):
+        self.scheduler.cancel_all()
+        self.network.stop()
+        if self.warmup_thread:
+            self.warmup_thread.wait(2000)
+        self.log_writer.close()
+        self.metrics.close()
+        self.store.close()
+
+    def new_conversation(self):
+        self.cancel()
+        self.history.clear()
+        self.images.clear()
+        self.compactor.reset()
+        self.conversation_id = None
+
+    def open_conversation(self, conversation_id):
+        self.cancel()
+        self.history.clear()
+        self.images.clear()
+        self.compactor.reset()
+        self.conversation_id = conversation_id
+
+        for row in self.store.last_turns(conversation_id, max(0, int(self.max_hist)) * 2):
+            self.history.append({'role': row['role'], 'text': row['text']})
+            if row['role'] == 'user' and row['image_id'] and self.is_img:
+                # only stored when image saving is on and it hasn't been pruned yet
+                image = self.images.get(row['image_id']) or self.store.load_image(row['image_id'])
+                if image:
+                    self.images[row['image_id']] = image
+                    self.history[-1]['image'] = row['image_id']
+
+        self.chat_window.show()
+        self.chat_window.set_output()
+        self.chat_window.scroll_to_bottom()
+
+    def on_request_delta(self, job, delta):
+        if job is not self.job:
+            return
+        self.loading_timer.stop()
+        self.chat_window.append_output(delta)
 
-        self.thread = RequestThread(model_type, url, headers, data)
-        self.thread.output_signal.connect(self.chat_window.set_output)
-        self.thread.finished_signal.connect(lambda text: self.on_request_finished(model_type, prompt, text))
-        self.thread.error_signal.connect(self.on_request_error)
+    def on_cache_hit(self, model, prompt, image, text):
+        self.text_content = text
+        self.add_history(model, prompt, image if model != 'ollama' else None, True)
+        self.add_history(model, text, None, False, cached=True)
+        self.chat_window.set_output('' if self.is_hist else text, cached=not self.is_hist)
+        self.main_window.set_button_loading_state(False)
 
-        self.thread.start()
+    def record_metrics(self, provider, model, job, status, text=''):
+        stats = dict(job.stats)
+        if status == 'ok' and 'output_tokens' not in stats:
+            stats['output_tokens'] = estimate_tokens(text)
+        self.metrics.record(provider, model, status, stats, self.timing)
 
-    def on_request_finished(self, model, prompt, text):
+    def on_request_finished(self, job, model, prompt, text):
+        if job is not self.job:
+            return
+        self.job = None
         self.loading_timer.stop()
+        self.deadline_timer.stop()
+        self.auto_jobs = []
+        self.record_metrics(model, self.current_model, job, 'ok', text)
         self.text_content = text
+        if self.cache_key:
+            self.cache.put(self.cache_key, text)
         self.add_history(model, text, None, False)
+        self.compact_history(model)
+        self.chat_window.reset_stream()
         self.chat_window.set_output()
         self.main_window.set_button_loading_state(False)
 
-    def on_request_error(self, error):
+    def on_request_error(self, job, model, error):
+        if job is not self.job:
+            return
+        self.job = None
         self.loading_timer.stop()
+        self.record_metrics(model, self.current_model, job, 'error')
         self.text_content = str(error)
+        self.chat_window.reset_stream()
         self.chat_window.set_output(f'Error: {self.text_content}')
         self.history.clear()
+        self.compactor.reset()
         self.main_window.set_button_loading_state(False)
 
-    def add_history(self, model, text, img_data, is_user):
+    def add_history(self, model, text, image, is_user, cached=False):
         if self.is_hist:
             if is_user:
                 self.history.append({'role': 'user', 'text': text})
-                if self.is_img:
-                    self.history[-1]['image'] = img_data
+                if self.is_img and image:
+                    # history only carries the id, the encoded bytes are kept once in self.images
+                    self.images[image.id] = image
+                    self.history[-1]['image'] = image.id
             else:
                 self.history.append({'role': 'model', 'text': text})
+                if cached:
+                    self.history[-1]['cached'] = True
 
-        with open(self.main_window.tool_spec.path + f'/res/logs/{model}.log', 'a', encoding='utf-8') as f:
-            if is_user:
-                f.write(f'{datetime.datetime.now()}\nQ: {text}\n')
-            else:
-                f.write(f'A: {text.replace("\n\n", "\n")}\n\n')
+        if self.conversation_id is None:
+            self.conversation_id = self.store.new_conversation(text)
+        self.store.add_turn(self.conversation_id, 'user' if is_user else 'model', model, self.current_model, text, image)
+
+        if is_user:
+            self.log_writer.log(model, self.current_model, 'user', text, image_bytes=len(image.data) if image else 0)
+        else:
+            latency_ms = 0 if cached else (time.perf_counter() - self.request_start) * 1000
+            self.log_writer.log(model, self.current_model, 'model', text, latency_ms=latency_ms)
 
         hist_limit = max(0, int(self.max_hist)) * 2
         if hist_limit == 0:
@@ -97,157 +496,241 @@ class AI:
         elif len(self.history) > hist_limit:
             self.history = self.history[-hist_limit:]
 
-    def ollama(self, model, prompt):
-        image_path = None
-        if self.is_img:
-            image_path = self.main_window.tool_spec.path + '/res/img/screenshot.png'
+        self.prune_images()
+
+    def compact_history(self, *providers):
+        # Ollama prompts go out without history, a summary would only hold up the local model
+        providers = [p for p in providers if p != 'ollama']
+        if self.is_hist and providers:
+            # a history shared by several providers has to fit the tightest budget
+            self.compactor.compact(min(providers, key=self.compactor.budget))
+            self.prune_images()
+
+    def prune_images(self):
+        referenced = {h.get('image') for h in self.history}
+        self.images = {k: v for k, v in self.images.items() if k in referenced}
 
-        self.thread = OllamaThread(model=model, prompt=prompt, image_path=image_path)
+    def ollama(self, model, prompt, image=None):
+        self.start_loading()
 
-        self.thread.output_signal.connect(self.chat_window.set_output)
-        self.thread.finished_signal.connect(lambda text: self.on_ollama_finished(prompt, text))
-        self.thread.error_signal.connect(self.on_ollama_error)
+        job = self.job = OllamaThread(self.ollama_client, model, prompt, image, self.ollama_keep_alive())
+        job.delta_signal.connect(lambda delta: self.on_request_delta(job, delta))
+        job.finished_signal.connect(lambda text: self.on_ollama_finished(job, prompt, text))
+        job.error_signal.connect(lambda error: self.on_ollama_error(job, error))
+        job.rate_limited_signal.connect(lambda _: job is self.job and self.on_rate_limited(job))
 
-        self.thread.start()
+        self.start_job(job)
 
-    def on_ollama_finished(self, prompt, text):
+    def on_ollama_finished(self, job, prompt, text):
+        if job is not self.job:
+            return
+        self.job = None
+        self.loading_timer.stop()
+        self.record_metrics('ollama', self.current_model, job, 'ok', text)
+        self.on_ollama_status(f'{self.current_model} ready')
         self.text_content = text
+        if self.cache_key:
+            self.cache.put(self.cache_key, text)
         self.add_history('ollama', text, None, False)
+        self.chat_window.reset_stream()
         self.chat_window.set_output()
         self.main_window.set_button_loading_state(False)
 
-    def on_ollama_error(self, error):
+    def on_ollama_error(self, job, error):
+        if job is not self.job:
+            return
+        self.job = None
+        self.loading_timer.stop()
+        self.record_metrics('ollama', self.current_model, job, 'error')
+        self.ollama_checked = 0
+        self.chat_window.reset_stream()
         self.chat_window.set_output(f'Error: {error}')
         self.main_window.set_button_loading_state(False)
 
-    def gemini(self, model, prompt, key):
+    def ollama_keep_alive(self):
+        return self.main_window.config['ollama']['keep_alive']
+
+    def warm_ollama(self):
+        if self.main_window.config['ollama']['warmup'] == 'off':
+            return
+        if self.warmup_thread and self.warmup_thread.isRunning():
+            return
+        if time.monotonic() - self.ollama_checked < 30:
+            return
+
+        self.ollama_checked = time.monotonic()
+        self.warmup_thread = OllamaWarmupThread(
+            self.ollama_client, self.main_window.config['ollama']['model'], self.ollama_keep_alive()
+        )
+        self.warmup_thread.status_signal.connect(self.on_ollama_status)
+        self.warmup_thread.start()
+
+    def on_ollama_status(self, status):
+        self.ollama_status = status
+        self.ollama_checked = time.monotonic()
+        self.main_window.update_placeholder()
+
+    def gemini(self, model, prompt, key, image=None, history=(), summary=''):
         key = key or 'APIKEY'
-        url = f'https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={key}'
+        if self.is_stream:
+            url = f'{self.main_window.config['gemini']['url']}/models/{model}:streamGenerateContent?alt=sse&key={key}'
+        else:
+            url = f'{self.main_window.config['gemini']['url']}/models/{model}:generateContent?key={key}'
         headers = {'Content-Type': 'application/json'}
         data = {'contents': []}
-        img_data = None
+        if summary:
+            data['system_instruction'] = {'parts': [{'text': f'Summary of the earlier conversation:\n{summary}'}]}
 
-        if self.is_hist:
-            for h in self.history:
-                data['contents'].append({'role': h['role'], 'parts': [{'text': h['text']}]})
+        attached = set()
 
-                if 'image' in h:
-                    data['contents'][-1]['parts'].append(
-                        {'inline_data': {'mime_type': 'image/png', 'data': h['image']}}
-                    )
+        for h in history:
+            data['contents'].append({'role': h['role'], 'parts': [{'text': h['text']}]})
+
+            img = self.images.get(h.get('image'))
+            if img and img.id not in attached:
+                attached.add(img.id)
+                data['contents'][-1]['parts'].append({'inline_data': {'mime_type': img.mime, 'data': img.base64()}})
 
         cur = {'role': 'user', 'parts': [{'text': prompt}]}
 
-        if self.is_img:
-            with open(self.main_window.tool_spec.path + '/res/img/screenshot.png', 'rb') as img_file:
-                img_data = base64.b64encode(img_file.read()).decode('utf-8')
-                cur['parts'].append({'inline_data': {'mime_type': 'image/png', 'data': img_data}})
+        if image and image.id in attached:
+            cur['parts'].append({'text': SAME_SCREEN_NOTE})
+        elif image:
+            cur['parts'].append({'inline_data': {'mime_type': image.mime, 'data': image.base64()}})
 
         data['contents'].append(cur)
-        self.add_history('gemini', prompt, img_data, True)
         return url, headers, data
 
-    def groq(self, model, prompt, key):
+    def groq(self, model, prompt, key, image=None, history=(), summary=''):
         key = key or 'APIKEY'
-        url = 'https://api.groq.com/openai/v1/chat/completions'
+        url = f'{self.main_window.config['groq']['url']}/chat/completions'
         headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {key}'}
-        data = {'messages': [], 'model': model, 'stream': False}
-        img_data = None
+        data = {'messages': [], 'model': model, 'stream': self.is_stream}
+        if summary:
+            data['messages'].append({'role': 'system', 'content': f'Summary of the earlier conversation:\n{summary}'})
 
-        if self.is_hist:
-            for h in self.history:
-                if h['role'] == 'user':
-                    data['messages'].append({'role': 'user', 'content': [{'type': 'text', 'text': h['text']}]})
+        attached = set()
 
-                    if 'image' in h:
-                        data['messages'][-1]['content'].append(
-                            {'type': 'image_url', 'image_url': {'url': f'data:image/png;base64,{h['image']}'}}
-                        )
-                else:
-                    data['messages'].append({'role': 'assistant', 'content': h['text']})
+        for h in history:
+            if h['role'] == 'user':
+                data['messages'].append({'role': 'user', 'content': [{'type': 'text', 'text': h['text']}]})
+
+                img = self.images.get(h.get('image'))
+                if img and img.id not in attached:
+                    attached.add(img.id)
+                    data['messages'][-1]['content'].append(
+                        {'type': 'image_url', 'image_url': {'url': f'data:{img.mime};base64,{img.base64()}'}}
+                    )
+            else:
+                data['messages'].append({'role': 'assistant', 'content': h['text']})
 
         cur = {'role': 'user', 'content': [{'type': 'text', 'text': prompt}]}
 
-        if self.is_img:
-            with open(self.main_window.tool_spec.path + '/res/img/screenshot.png', 'rb') as img_file:
-                img_data = base64.b64encode(img_file.read()).decode('utf-8')
-                cur['content'].append({'type': 'image_url', 'image_url': {'url': f'data:image/png;base64,{img_data}'}})
+        if image and image.id in attached:
+            cur['content'].append({'type': 'text', 'text': SAME_SCREEN_NOTE})
+        elif image:
+            cur['content'].append({'type': 'image_url', 'image_url': {'url': f'data:{image.mime};base64,{image.base64()}'}})
 
         data['messages'].append(cur)
-        self.add_history('groq', prompt, img_data, True)
         return url, headers, data
 
 
 class OllamaThread(QThread):
-    output_signal = Signal(str)
+    delta_signal = Signal(str)
     finished_signal = Signal(str)
     error_signal = Signal(str)
+    rate_limited_signal = Signal(float)
+    model_type = 'ollama'
 
-    def __init__(self, model, prompt, image_path=None, parent=None):
+    def __init__(self, client, model, prompt, image=None, keep_alive=None, parent=None):
         super().__init__(parent)
+        self.client = client
         self.model = model
         self.prompt = prompt
-        self.image_path = image_path
-        self.client = ollama.Client(host='http://localhost:11434')
+        self.image = image
+        self.keep_alive = keep_alive
+        self.cancelled = False
+        self.retries = 0
+        self.max_retries = 0
+        self.queued_at = 0
+        self.stats = {}
+
+    def cancel(self):
+        self.cancelled = True
 
     def run(self):
+        started = time.perf_counter()
+        self.stats = {'upload_bytes': len(self.prompt.encode('utf-8')) + (len(self.image) if self.image else 0)}
+        if self.retries:
+            self.stats['retries'] = self.retries
         try:
             messages = {
                 'role': 'user',
                 'content': self.prompt,
             }
 
-            if self.image_path:
-                messages['images'] = [self.image_path]
+            if self.image:
+                messages['images'] = [self.image]
 
-            response = self.client.chat(model=self.model, stream=True, messages=[messages])
+            response = self.client.chat(
+                model=self.model, stream=True, messages=[messages], keep_alive=self.keep_alive
+            )
 
-            text = ''
+            chunks = []
             for chunk in response:
-                content = chunk['message']['content']
-                text += content
-                self.output_signal.emit(text)
+                if self.cancelled:
+                    response.close()
+                    return
+
+                if chunk.get('eval_count'):
+                    self.stats['output_tokens'] = chunk['eval_count']
 
-            self.finished_signal.emit(text)
+                content = chunk['message']['content']
+                if content:
+                    if 'ttft_ms' not in self.stats:
+                        self.stats['ttft_ms'] = (time.perf_counter() - started) * 1000
+                    chunks.append(content)
+                    self.delta_signal.emit(content)
+
+            self.stats['total_ms'] = (time.perf_counter() - started) * 1000
+            self.finished_signal.emit(''.join(chunks))
+
+        except ollama.ResponseError as e:
+            # 503 means the server queue is full, which is worth a retry like a 429 from the cloud providers
+            self.stats['total_ms'] = (time.perf_counter() - started) * 1000
+            if e.status_code in (429, 503) and self.retries < self.max_retries:
+                self.retries += 1
+                self.rate_limited_signal.emit(0.0)
+            else:
+                self.error_signal.emit(str(e))
 
         except Exception as e:
+            self.stats['total_ms'] = (time.perf_counter() - started) * 1000
             self.error_signal.emit(str(e))
 
 
-class RequestThread(QThread):
-    output_signal = Signal(str)
-    finished_signal = Signal(str)
-    error_signal = Signal(str)
+class OllamaWarmupThread(QThread):
+    status_signal = Signal(str)
 
-    def __init__(self, model_type, url, headers, data, parent=None):
+    def __init__(self, client, model, keep_alive=None, parent=None):
         super().__init__(parent)
-        self.model_type = model_type
-        self.url = url
-        self.headers = headers
-        self.data = data
+        self.client = client
+        self.model = model
+        self.keep_alive = keep_alive
 
-    def run(self):
-        asyncio.run(self._make_request())
+    def is_resident(self):
+        name = self.model if ':' in self.model else f'{self.model}:latest'
+        return any(m.model in (self.model, name) for m in self.client.ps().models)
 
-    async def _make_request(self):
+    def run(self):
         try:
-            async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=30.0)) as client:
-                response = await client.post(self.url, headers=self.headers, json=self.data)
-
-            res = response.json()
-
-            if 'error' in res:
-                raise Exception(res['error']['message'])
+            if not self.is_resident():
+                self.status_signal.emit(f'loading {self.model}')
+                # an empty prompt only loads the model into memory
+                self.client.generate(model=self.model, prompt='', keep_alive=self.keep_alive)
 
-            if self.model_type == 'gemini':
-                text = res['candidates'][0]['content']['parts'][0]['text']
-            elif self.model_type == 'groq':
-                text = res['choices'][0]['message']['content']
-            else:
-                raise Exception('Unknown model type')
-
-            self.output_signal.emit(text)
-            self.finished_signal.emit(text)
+            self.status_signal.emit(f'{self.model} ready')
 
         except Exception as e:
-            self.error_signal.emit(str(e))
+            print('Ollama warm-up failed:', e)
+            self.status_signal.emit('offline')
@@ -0,0 +1,109 @@
+import datetime
+import glob
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+
+
+class ChatLogWriter:
+    """Writes chat logs from a background thread, rotating and gzipping full or stale segments."""
+
+    def __init__(self, log_dir, fmt='text', max_bytes=1024 * 1024, rotate_daily=True, keep=5, flush_interval=1.0):
+        self.log_dir = log_dir
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.keep = keep
+        self.flush_interval = flush_interval
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def log(self, provider, model, role, text, latency_ms=None, image_bytes=0):
+        if self.fmt == 'off':
+            return
+
+        self.queue.put({
+            'time': datetime.datetime.now().isoformat(sep=' ', timespec='seconds'),
+            'provider': provider,
+            'model': model,
+            'role': role,
+            'text': text,
+            'latency_ms': None if latency_ms is None else round(latency_ms),
+            'bytes': len(text.encode('utf-8')),
+            'image_bytes': image_bytes,
+        })
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+
+    def _run(self):
+        running = True
+        while running:
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=self.flush_interval))
+                while True:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if None in batch:
+                running = False
+                batch = [r for r in batch if r is not None]
+
+            if batch:
+                try:
+                    self._flush(batch)
+                except OSError as e:
+                    print('Error writing chat log:', e)
+
+    def _flush(self, batch):
+        lines = {}
+        for r in batch:
+            lines.setdefault(r['provider'], []).append(self._format(r))
+
+        for provider, entries in lines.items():
+            path = os.path.join(self.log_dir, f'{provider}.{"jsonl" if self.fmt == "jsonl" else "log"}')
+            self._rotate_if_needed(path)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(''.join(entries))
+
+    def _format(self, r):
+        if self.fmt == 'jsonl':
+            return json.dumps(r, ensure_ascii=False) + '\n'
+
+        if r['role'] == 'user':
+            return f'{r["time"]}\nQ: {r["text"]}\n'
+        return f'A: {r["text"].replace("\n\n", "\n")}\n\n'
+
+    def _rotate_if_needed(self, path):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+
+        modified = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+        is_full = self.max_bytes and os.path.getsize(path) >= self.max_bytes
+        is_stale = self.rotate_daily and modified.date() != datetime.date.today()
+        if not is_full and not is_stale:
+            return
+
+        base, ext = os.path.splitext(path)
+        rotated = f'{base}-{modified.strftime("%Y%m%d-%H%M%S")}{ext}'
+        n = 1
+        while os.path.exists(rotated + '.gz'):
+            rotated = f'{base}-{modified.strftime("%Y%m%d-%H%M%S")}-{n}{ext}'
+            n += 1
+        os.replace(path, rotated)
+
+        with open(rotated, 'rb') as src, gzip.open(rotated + '.gz', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+
+        segments = sorted(glob.glob(f'{glob.escape(base)}-*{ext}.gz'))
+        for old in segments[:max(0, len(segments) - self.keep)]:
+            os.remove(old)
@@ -1,8 +1,10 @@
+import hashlib
+
 from markdown import markdown
 from pygments.formatters.html import HtmlFormatter
-from PySide6.QtCore import QRect
-from PySide6.QtGui import QGuiApplication
-from PySide6.QtWidgets import QApplication, QTextBrowser
+from PySide6.QtCore import QRect, QTimer
+from PySide6.QtGui import QGuiApplication, QTextCursor
+from PySide6.QtWidgets import QTextBrowser
 
 
 from qlib.windows.quol_window import QuolSubWindow
@@ -15,37 +17,128 @@ class ChatWindow(QuolSubWindow):
         self.setGeometry(QRect(screen_geometry.width() - 510, screen_geometry.height() - 610, 500, 600))
 
         with open(main_window.tool_spec.path + '/res/styles.css') as f:
-            self.style_tag = f'<style>{HtmlFormatter(style='monokai').get_style_defs('.codehilite')}{f.read()}</style>'
+            self.style_sheet = f'{HtmlFormatter(style='monokai').get_style_defs('.codehilite')}{f.read()}'
 
         self.chat_response = QTextBrowser()
         self.chat_response.setOpenExternalLinks(True)
         self.chat_response.setReadOnly(True)
+        self.chat_response.document().setDefaultStyleSheet(self.style_sheet)
         self.layout.addWidget(self.chat_response, stretch=1)
 
-    def set_output(self, text=''):
-        data = ''.join(
-            f'''
-                <table width="100%">
-                  <tr>
-                    <td align="{'left' if h['role'] == 'model' else 'right'}" class="{'ai-block' if h['role'] == 'model' else 'user-block'}"><div>{markdown(h['text'], extensions=["fenced_code", "codehilite"])}</div></td>
-                  </tr>
-                </table>
-            ''' for h in self.main_window.ai.history + [{'role': 'model', 'text': text}]
+        # rendered html per finished message, and the messages currently in the document
+        self.render_cache = {}
+        self.rendered = None
+        self.tail_start = 0
+
+        # streamed deltas are buffered per column and drawn at most once per render interval
+        self.stream_chunks = {}
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.setInterval(main_window.config['config']['render_interval_ms'])
+        self.render_timer.timeout.connect(self.flush_stream)
+
+    @staticmethod
+    def message_key(h):
+        return h['role'], hashlib.sha1(h['text'].encode('utf-8')).hexdigest(), h.get('cached', False)
+
+    @staticmethod
+    def close_fences(text):
+        fences = sum(1 for line in text.splitlines() if line.lstrip().startswith('```'))
+        return text + '\n```' if fences % 2 else text
+
+    def render_message(self, role, text, cached=False):
+        text = self.close_fences(text)
+        note = '<p class="cached">cached</p>' if cached else ''
+        return f'''
+            <table width="100%">
+              <tr>
+                <td align="{'left' if role == 'model' else 'right'}" class="{'ai-block' if role == 'model' else 'user-block'}"><div>{markdown(text, extensions=["fenced_code", "codehilite"])}{note}</div></td>
+              </tr>
+            </table>
+        '''
+
+    def render_cached(self, h):
+        key = self.message_key(h)
+        if key not in self.render_cache:
+            self.render_cache[key] = self.render_message(h['role'], h['text'], h.get('cached', False))
+        return self.render_cache[key]
+
+    def sync_history(self):
+        history = self.main_window.ai.history
+        n = len(self.rendered or [])
+
+        # messages are compared by identity so unchanged turns are never re-hashed or re-rendered
+        if self.rendered is None or len(history) < n or any(a is not b for a, b in zip(history, self.rendered)):
+            keys = {self.message_key(h) for h in history}
+            self.render_cache = {k: v for k, v in self.render_cache.items() if k in keys}
+            html = ''.join(self.render_cached(h) for h in history)
+            self.chat_response.setHtml(f'<style>{self.style_sheet}</style><body>{html}</body>')
+            self.rendered = list(history)
+            self.tail_start = self.end_position()
+            return
+
+        if len(history) > n:
+            cursor = self.tail_cursor()
+            cursor.removeSelectedText()
+            for h in history[n:]:
+                cursor.insertHtml(self.render_cached(h))
+                self.rendered.append(h)
+            self.tail_start = self.end_position()
+
+    def invalidate(self):
+        self.rendered = None
+
+    def end_position(self):
+        return self.chat_response.document().characterCount() - 1
+
+    def tail_cursor(self):
+        cursor = QTextCursor(self.chat_response.document())
+        cursor.setPosition(min(self.tail_start, self.end_position()))
+        cursor.movePosition(QTextCursor.MoveOperation.End, QTextCursor.MoveMode.KeepAnchor)
+        return cursor
+
+    def append_output(self, delta, column=None):
+        self.stream_chunks.setdefault(column, []).append(delta)
+        if not self.render_timer.isActive():
+            self.render_timer.start()
+
+    def flush_stream(self):
+        if list(self.stream_chunks) == [None]:
+            self.set_output(''.join(self.stream_chunks[None]))
+        else:
+            self.set_output(columns={k: ''.join(v) for k, v in self.stream_chunks.items()})
+
+    def reset_stream(self):
+        self.render_timer.stop()
+        self.stream_chunks = {}
+
+    def render_columns(self, columns):
+        width = 100 // max(1, len(columns))
+        cells = ''.join(
+            f'<td width="{width}%" class="ai-block"><div><b>{name}</b>{markdown(self.close_fences(text), extensions=["fenced_code", "codehilite"])}</div></td>'
+            for name, text in columns.items()
         )
+        return f'<table width="100%"><tr>{cells}</tr></table>'
 
+    def set_output(self, text='', columns=None, cached=False):
         scrollbar = self.chat_response.verticalScrollBar()
         scroll_pos = scrollbar.value()
         was_near_bottom = scroll_pos >= (scrollbar.maximum() - 24)
 
-        formatted_text = f'{self.style_tag}<body>{data}</body>'
-        self.chat_response.setHtml(formatted_text)
+        self.sync_history()
+
+        # only the in-progress message is re-rendered, everything above it stays in the document
+        cursor = self.tail_cursor()
+        cursor.removeSelectedText()
+        if columns:
+            cursor.insertHtml(self.render_columns(columns))
+        elif text:
+            cursor.insertHtml(self.render_message('model', text, cached))
 
         if was_near_bottom:
             scrollbar.setValue(scrollbar.maximum())
         else:
             scrollbar.setValue(scroll_pos)
-        self.chat_response.repaint()
-        QApplication.processEvents()
 
     def scroll_to_bottom(self):
         scrollbar = self.chat_response.verticalScrollBar()
@@ -55,4 +148,4 @@ class ChatWindow(QuolSubWindow):
         print('Window closed')
         super().closeEvent(event)
         # self.setGeometry(QRect(self.g[0], self.g[1], self.g[2], self.g[3]))
-        self.main_window.ai.history.clear()
+        self.main_window.ai.new_conversation()
@@ -0,0 +1,116 @@
+SUMMARY_PROMPT = (
+    'Summarize the conversation below in a few short bullet points so it can replace the original turns. '
+    'Keep names, numbers, code identifiers and any open questions. Reply with the summary only.\n\n'
+)
+
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for budgeting across providers
+    return len(text) // 4 + 1
+
+
+class HistoryCompactor:
+    """Keeps the history sent to a provider under its token budget by dropping old images and summarizing old turns."""
+
+    def __init__(self, ai: 'AI'):
+        self.ai = ai
+        self.summary = ''
+        self.job = None
+        self.pending = []
+
+    @property
+    def config(self):
+        return self.ai.main_window.config['compaction']
+
+    def budget(self, provider):
+        return self.ai.main_window.config.get(provider, {}).get('context_tokens', self.config['context_tokens'])
+
+    def history_tokens(self, history):
+        seen = set()
+        total = estimate_tokens(self.summary) if self.summary else 0
+
+        for h in history:
+            total += estimate_tokens(h['text'])
+            if h.get('image') and h['image'] not in seen:
+                seen.add(h['image'])
+                total += self.config['image_tokens']
+        return total
+
+    def fit(self, provider, prompt, image=None):
+        history = self.ai.history
+        reserve = estimate_tokens(prompt) + (self.config['image_tokens'] if image else 0)
+        budget = self.budget(provider) - reserve
+
+        # whole turns are dropped oldest first so a user message never loses its answer
+        start = 0
+        while start < len(history) and self.history_tokens(history[start:]) > budget:
+            start += 2 if start + 1 < len(history) and history[start]['role'] == 'user' else 1
+        return history[start:]
+
+    def compact(self, provider):
+        history = self.ai.history
+        budget = self.budget(provider) * self.config['target_ratio']
+        if self.history_tokens(history) <= budget:
+            return
+
+        latest_image = next((h['image'] for h in reversed(history) if h.get('image')), None)
+        for h in history:
+            if self.history_tokens(history) <= budget:
+                return
+            if h.get('image') and h['image'] != latest_image:
+                del h['image']
+
+        keep = max(2, int(self.config['keep_turns']) * 2)
+        if self.history_tokens(history) <= budget or len(history) <= keep or self.job is not None:
+            return
+
+        # the old turns stay in the history until their summary exists, fit() keeps requests in budget meanwhile
+        self.pending = history[:-keep]
+        summarizer = provider if self.config['summarizer'] == 'same' else self.config['summarizer']
+        self.summarize(provider, summarizer)
+
+    def summarize(self, provider, summarizer):
+        transcript = '\n'.join(f'{h["role"]}: {h["text"]}' for h in self.pending)
+        if self.summary:
+            transcript = f'Earlier summary:\n{self.summary}\n\n{transcript}'
+
+        config = self.ai.main_window.config[summarizer]
+        job = self.job = self.ai.create_job(
+            summarizer, config['model'], SUMMARY_PROMPT + transcript, config.get('apikey'), with_history=False
+        )
+        job.finished_signal.connect(lambda text: self.on_summary(job, text))
+        job.error_signal.connect(lambda error: self.on_summary_error(job, provider, summarizer, error))
+        self.ai.start_job(job)
+
+    def on_summary(self, job, text):
+        if job is not self.job:
+            return
+        self.job = None
+        if not text.strip():
+            self.pending = []
+            return
+
+        summarized = {id(h) for h in self.pending}
+        self.ai.history[:] = [h for h in self.ai.history if id(h) not in summarized]
+        self.summary = text.strip()
+        self.pending = []
+        self.ai.prune_images()
+
+    def on_summary_error(self, job, provider, summarizer, error):
+        if job is not self.job:
+            return
+        print('Error summarizing history:', error)
+        self.job = None
+
+        if summarizer != provider:
+            # e.g. no local Ollama, the provider that is answering anyway can summarize instead
+            self.summarize(provider, provider)
+        else:
+            self.pending = []
+
+    def reset(self):
+        if self.job is not None:
+            self.ai.cancel_job(self.job)
+        self.summary = ''
+        self.job = None
+        self.pending = []
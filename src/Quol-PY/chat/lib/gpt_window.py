@@ -1,20 +1,25 @@
-from PySide6.QtCore import QThread, Signal, QTimer
-from PySide6.QtGui import QGuiApplication
-from PySide6.QtWidgets import QHBoxLayout, QTextBrowser, QApplication
+import html
+import os
+import tempfile
+import threading
+
+from PySide6.QtCore import QDeadlineTimer, QThread, Signal, QTimer
+from PySide6.QtGui import QTextCursor
+from PySide6.QtWidgets import QHBoxLayout, QTextBrowser
 
 from qlib.windows.quol_window import QuolSubWindow
-from qlib.windows.tool_loader import ToolSpec
-# from simulator import Simulator
+from lib.screenshot import capture_screen
+from lib.simulator import Simulator
 
 test_response = ['']
+SHUTDOWN_WAIT_MS = 3000
 
 
 class GPTWindow(QuolSubWindow):
     def __init__(self, main_window):
         super().__init__(main_window, 'GPT')
         self.setGeometry(1200, 410, 500, 600)
-        self.tool_spec: WindowInfo = main_window.tool_spec
-        self.tool_spec: WindowContext = main_window.tool_spec
+        self.tool_spec = main_window.tool_spec
 
         self.output_box = QTextBrowser(self)
         self.output_box.setOpenExternalLinks(True)
@@ -22,16 +27,34 @@ class GPTWindow(QuolSubWindow):
         self.layout.addWidget(self.output_box)
 
         with open(self.tool_spec.path + '/res/gptstyles.css') as f:
-            self.style_tag = '<style>' + f.read() + '</style>'
+            style_sheet = f.read()
+        self.output_box.document().setDefaultStyleSheet(style_sheet)
+        self.output_box.setHtml(f'<style>{style_sheet}</style><body></body>')
+
+        # blocks are re-rendered from the oldest one that changed, at most once per render interval
+        self.block_starts = []
+        self.dirty = None
+        self.extra = ''
+        self.extra_start = 0
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.setInterval(main_window.config['config']['render_interval_ms'])
+        self.render_timer.timeout.connect(self.flush_output)
 
         self.l2 = QHBoxLayout()
         self.layout.addLayout(self.l2)
 
-        self.simulator = Simulator()
-        self.simulate_thread = None
+        gpt_config = main_window.config['gpt']
+        self.simulator = Simulator(self.tool_spec.path + '/' + gpt_config['profile'], gpt_config['tabs'])
+        self.simulate_threads = set()
+        # cancelled threads are kept referenced until they return from their last driver call
+        self.stopped_threads = set()
         self.history = []
         self.set_output()
-        self.loading_counter = 0
+
+        # the browser starts in the background so the first prompt doesn't wait for it
+        self.reload_thread = ReloadThread(self.simulator, gpt_config['headless'])
+        self.reload_thread.start()
 
         with open(self.tool_spec.path + '/test_response.txt', 'r') as f:
             test_response[0] = f.read()
@@ -39,46 +62,82 @@ class GPTWindow(QuolSubWindow):
         if test_response[0]:
             self.set_output(test_response[0])
 
-    def on_send(self, input_field, toggle_image_button):
-        prompt = input_field.text()
-        if not prompt.strip() or not self.simulator.is_loaded:
+    def on_send(self, prompt, with_image):
+        if not prompt.strip():
             return
-
-        input_field.clear()
         self.show()
-        self.loading_counter = 0
+        if not self.simulator.is_loaded:
+            self.set_output('<p>GPT is still loading.</p>')
+            return
 
         img_path = None
-        if toggle_image_button.isChecked():
-            screen = QGuiApplication.primaryScreen()
-            self.tool_spec.toggle_windows_instant(True)
-            screenshot = screen.grabWindow(0).toImage()
-            self.tool_spec.toggle_windows_instant(False)
-            img_path = self.tool_spec.path + '/res/img/screenshot.png'
+        if with_image:
+            self.tool_spec.toggle_instant_signal.emit(False)
+            screenshot = capture_screen(self.main_window.config['image']['screen'])
+            self.tool_spec.toggle_instant_signal.emit(True)
+            fd, img_path = tempfile.mkstemp(suffix='.png')
+            os.close(fd)
             screenshot.save(img_path)
 
-        def on_loading():
-            self.loading_counter += 0.1
-            self.set_output(f'<p>Loading... ({self.loading_counter:.1f}s)</p>')
+        # every prompt owns a slot in the history so parallel answers stream into their own block
+        self.history.append(('user', '<p>' + html.escape(prompt) + '</p>'))
+        self.history.append(('ai', ''))
+        index = len(self.history) - 1
+        self.set_output()
+        loading_counter = [0]
 
-        timer = QTimer()
+        def on_loading():
+            if thread not in self.simulate_threads:
+                timer.stop()
+                return
+            loading_counter[0] += 0.1
+            self.history[index] = ('ai', f'<p>Loading... ({loading_counter[0]:.1f}s)</p>')
+            self.invalidate(index)
+
+        timer = QTimer(self)
         timer.timeout.connect(on_loading)
         timer.start(100)
 
-        self.history.append(('user', '<p>' + prompt + '</p>'))
-        self.simulate_thread = SimulateThread(self.simulator, prompt, img_path=img_path)
-        self.simulate_thread.response_signal.connect(lambda response: self.set_output(response))
-        self.simulate_thread.loaded_signal.connect(lambda: timer.stop())
-        self.simulate_thread.finished_signal.connect(lambda response: self.history.append(('ai', response)))
-        self.simulate_thread.start()
+        thread = SimulateThread(self.simulator, prompt, img_path=img_path)
+        stream = ['']
+        thread.delta_signal.connect(lambda delta: self.on_delta(index, thread, stream, stream[0] + delta))
+        thread.reset_signal.connect(lambda text: self.on_delta(index, thread, stream, text))
+        thread.loaded_signal.connect(timer.stop)
+        thread.finished_signal.connect(lambda response: self.on_finished(index, thread, timer, response, img_path))
+        self.simulate_threads.add(thread)
+        thread.start()
+
+    def on_delta(self, index, thread, stream, text):
+        stream[0] = text
+        if thread in self.simulate_threads:
+            self.history[index] = ('ai', f'<p style="white-space: pre-wrap">{html.escape(text)}</p>')
+            self.invalidate(index)
+
+    def on_finished(self, index, thread, timer, response, img_path=None):
+        timer.stop()
+        self.stopped_threads.discard(thread)
+        if img_path:
+            os.remove(img_path)
+        if thread in self.simulate_threads:
+            self.simulate_threads.discard(thread)
+            self.history[index] = ('ai', response)
+            self.invalidate(index)
+
+    def stop_threads(self):
+        # nothing waits here, a cancelled thread gives up within one poll of the browser
+        for thread in self.simulate_threads:
+            thread.cancel()
+        self.stopped_threads |= self.simulate_threads
+        self.simulate_threads = set()
 
     def on_clear(self):
         self.history = []
         self.set_output()
-        if self.simulate_thread and self.simulate_thread.isRunning():
-            self.simulate_thread.requestInterruption()
-            self.simulate_thread.wait()
-        self.simulator.refresh()
+        self.stop_threads()
+        if not self.reload_thread.isRunning():
+            # refreshing navigates every tab, which is too slow for the GUI thread
+            self.reload_thread = ReloadThread(self.simulator, self.main_window.config['gpt']['headless'])
+            self.reload_thread.start()
 
     def on_image(self, toggle_image_button):
         if toggle_image_button.isChecked():
@@ -100,39 +159,66 @@ class GPTWindow(QuolSubWindow):
             clear_btn.setEnabled(True)
             self.set_output('<p>GPT loaded successfully.</p>')
 
-        self.simulate_thread = ReloadThread(self.simulator, self.main_window.config['gpt']['headless'])
-        self.simulate_thread.finished_signal.connect(on_finished)
-        self.simulate_thread.start()
+        self.reload_thread = ReloadThread(self.simulator, self.main_window.config['gpt']['headless'])
+        self.reload_thread.finished_signal.connect(on_finished)
+        self.reload_thread.start()
 
     def set_output(self, text=''):
-        data = ''.join(
-            f'''
-                <table width="100%">
-                  <tr>
-                    <td align="{'left' if s == 'ai' else 'right'}" class="{'ai-block' if s == 'ai' else 'user-block'}">{content}</td>
-                  </tr>
-                </table>
-            ''' for s, content in self.history + [['ai', text]]
-        )
+        self.extra = text
+        self.invalidate(len(self.history))
+
+    def invalidate(self, index):
+        self.dirty = index if self.dirty is None else min(self.dirty, index)
+        if not self.render_timer.isActive():
+            self.render_timer.start()
+
+    @staticmethod
+    def render_block(s, content):
+        return f'''
+            <table width="100%">
+              <tr>
+                <td align="{'left' if s == 'ai' else 'right'}" class="{'ai-block' if s == 'ai' else 'user-block'}">{content}</td>
+              </tr>
+            </table>
+        '''
+
+    def end_position(self):
+        return self.output_box.document().characterCount() - 1
+
+    def flush_output(self):
+        if self.dirty is None:
+            return
+        start = min(self.dirty, len(self.history), len(self.block_starts))
+        self.dirty = None
 
         scrollbar = self.output_box.verticalScrollBar()
         scroll_pos = scrollbar.value()
-
-        formatted_text = f'{self.style_tag}<body>{data}</body>'
-        self.output_box.setHtml(formatted_text)
-
-        scrollbar.setValue(scroll_pos)
-        self.output_box.repaint()
-        QApplication.processEvents()
-
-    def closeEvent(self, event):
-        self.hide()
-        self.output_box.clear()
-        if self.simulate_thread and self.simulate_thread.isRunning():
-            self.simulate_thread.requestInterruption()
-            self.simulate_thread.wait()
-        self.simulator.close()
-        super().close()
+        was_near_bottom = scroll_pos >= (scrollbar.maximum() - 24)
+
+        # finished answers above the oldest changed block stay in the document untouched
+        cursor = QTextCursor(self.output_box.document())
+        cursor.setPosition(self.block_starts[start] if start < len(self.block_starts) else self.extra_start)
+        cursor.movePosition(QTextCursor.MoveOperation.End, QTextCursor.MoveMode.KeepAnchor)
+        cursor.removeSelectedText()
+
+        del self.block_starts[start:]
+        for s, content in self.history[start:]:
+            self.block_starts.append(self.end_position())
+            cursor.insertHtml(self.render_block(s, content))
+        self.extra_start = self.end_position()
+        if self.extra:
+            cursor.insertHtml(self.render_block('ai', self.extra))
+
+        scrollbar.setValue(scrollbar.maximum() if was_near_bottom else scroll_pos)
+
+    def shutdown(self):
+        self.stop_threads()
+        # quitting the browser makes any driver call still running in a worker fail right away
+        threading.Thread(target=self.simulator.close).start()
+        deadline = QDeadlineTimer(SHUTDOWN_WAIT_MS)
+        for thread in [self.reload_thread, *self.stopped_threads]:
+            thread.wait(deadline)
+        self.close()
 
 
 class ReloadThread(QThread):
@@ -149,7 +235,8 @@ class ReloadThread(QThread):
 
 
 class SimulateThread(QThread):
-    response_signal = Signal(str)
+    delta_signal = Signal(str)
+    reset_signal = Signal(str)
     loaded_signal = Signal()
     finished_signal = Signal(str)
 
@@ -158,14 +245,29 @@ class SimulateThread(QThread):
         self.simulator = ai
         self.input_text = input_text
         self.img_path = img_path
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.requestInterruption()
 
     def run(self):
         res = ''
         is_loaded = False
-        for response in self.simulator.submit(self.input_text, img_path=self.img_path):
+        for event in self.simulator.submit(self.input_text, img_path=self.img_path, cancel=self.cancel_event):
+            if self.isInterruptionRequested():
+                break
+
             if not is_loaded:
                 self.loaded_signal.emit()
                 is_loaded = True
-            res = response
-            self.response_signal.emit(res)
+
+            if event['type'] == 'delta':
+                self.delta_signal.emit(event['text'])
+            elif event['type'] == 'reset':
+                self.reset_signal.emit(event['text'])
+            elif event['type'] == 'done':
+                res = event['html']
+            elif event['type'] == 'error':
+                res = f'<p>Error: {html.escape(event["text"])}</p>'
         self.finished_signal.emit(res)
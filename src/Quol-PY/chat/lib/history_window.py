@@ -0,0 +1,102 @@
+import datetime
+
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QTextCursor
+from PySide6.QtWidgets import QHBoxLayout, QLineEdit, QListWidget, QListWidgetItem, QPushButton, QTextBrowser
+
+from qlib.windows.quol_window import QuolSubWindow
+
+PAGE_SIZE = 20
+
+
+class HistoryWindow(QuolSubWindow):
+    def __init__(self, main_window):
+        super().__init__(main_window, 'Chat History')
+        self.setGeometry(560, 200, 500, 600)
+        self.store = main_window.ai.store
+
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText('Search conversations...')
+        self.layout.addWidget(self.search_input)
+
+        self.results = QListWidget()
+        self.layout.addWidget(self.results, stretch=1)
+
+        self.preview = QTextBrowser()
+        self.preview.setOpenExternalLinks(True)
+        self.preview.document().setDefaultStyleSheet(main_window.chat_window.style_sheet)
+        self.layout.addWidget(self.preview, stretch=2)
+
+        self.button_layout = QHBoxLayout()
+        self.open_btn = QPushButton('Continue')
+        self.open_btn.setEnabled(False)
+        self.button_layout.addWidget(self.open_btn)
+        self.layout.addLayout(self.button_layout)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(200)
+
+        self.conversation_id = None
+        self.loaded_turns = 0
+        self.has_more = False
+
+        self.search_input.textChanged.connect(lambda: self.search_timer.start())
+        self.search_timer.timeout.connect(self.refresh)
+        self.results.currentItemChanged.connect(self.on_select)
+        self.preview.verticalScrollBar().valueChanged.connect(self.on_scroll)
+        self.open_btn.clicked.connect(self.on_open)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+
+    def refresh(self):
+        query = self.search_input.text().strip()
+        rows = self.store.search(query) if query else self.store.recent_conversations()
+
+        self.results.clear()
+        for row in rows:
+            date = datetime.datetime.fromtimestamp(row['updated_at']).strftime('%Y-%m-%d %H:%M')
+            snippet = (row['snippet'] or '').replace('<b>', '').replace('</b>', '').replace('\n', ' ')
+            item = QListWidgetItem(f'{date} · {row["provider"] or "-"} · {snippet}')
+            item.setData(Qt.ItemDataRole.UserRole, row['conversation_id'])
+            self.results.addItem(item)
+
+    def on_select(self, item):
+        self.has_more = False
+        self.preview.clear()
+        self.open_btn.setEnabled(item is not None)
+        if item is None:
+            self.conversation_id = None
+            return
+
+        self.conversation_id = item.data(Qt.ItemDataRole.UserRole)
+        self.loaded_turns = 0
+        self.has_more = True
+        self.load_page()
+
+    def load_page(self):
+        if not self.has_more or self.conversation_id is None:
+            return
+
+        rows = self.store.load_turns(self.conversation_id, self.loaded_turns, PAGE_SIZE)
+        self.loaded_turns += len(rows)
+        self.has_more = len(rows) == PAGE_SIZE
+
+        cursor = QTextCursor(self.preview.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        for row in rows:
+            cursor.insertHtml(self.main_window.chat_window.render_message(row['role'], row['text']))
+
+        if self.has_more and self.preview.verticalScrollBar().maximum() == 0:
+            QTimer.singleShot(0, self.load_page)
+
+    def on_scroll(self, value):
+        # the next page is only read from disk once the preview is scrolled to the bottom
+        if value >= self.preview.verticalScrollBar().maximum():
+            self.load_page()
+
+    def on_open(self):
+        if self.conversation_id is not None:
+            self.main_window.ai.open_conversation(self.conversation_id)
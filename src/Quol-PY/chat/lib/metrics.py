@@ -0,0 +1,119 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+FIELDS = ('capture_ms', 'encode_ms', 'upload_bytes', 'ttft_ms', 'total_ms', 'tokens_per_s')
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class MetricsRecorder:
+    """Rolling per provider/model request timings, mirrored to a JSONL file from a background thread."""
+
+    def __init__(self, path, window=100, max_bytes=1024 * 1024):
+        self.path = path
+        self.window = window
+        self.max_bytes = max_bytes
+        self.samples = {}
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self._add(json.loads(line))
+                    except (ValueError, KeyError):
+                        continue
+        except OSError:
+            pass
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _add(self, sample):
+        key = (sample['provider'], sample['model'])
+        if key not in self.samples:
+            self.samples[key] = deque(maxlen=self.window)
+        self.samples[key].append(sample)
+
+    def record(self, provider, model, status, stats, timing=None):
+        sample = {'ts': time.time(), 'provider': provider, 'model': model, 'status': status}
+        sample.update(timing or {})
+        sample.update(stats)
+
+        generation_ms = sample.get('total_ms', 0) - sample.get('ttft_ms', 0)
+        if status == 'ok' and sample.get('output_tokens') and generation_ms > 0:
+            sample['tokens_per_s'] = sample['output_tokens'] / (generation_ms / 1000)
+
+        with self.lock:
+            self._add(sample)
+            self.queue.put(sample)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+
+    def _run(self):
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            try:
+                while True:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if None in batch:
+                running = False
+                batch = [s for s in batch if s is not None]
+
+            if batch:
+                try:
+                    self._flush(batch)
+                except OSError as e:
+                    print('Error writing metrics:', e)
+
+    def _flush(self, batch):
+        if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+            # keep only what is still inside the rolling windows, samples still queued are part of it already
+            with self.lock:
+                batch = [s for samples in self.samples.values() for s in samples]
+                while not self.queue.empty():
+                    if self.queue.get_nowait() is None:
+                        self.queue.put(None)
+                        break
+            mode = 'w'
+        else:
+            mode = 'a'
+
+        with open(self.path, mode, encoding='utf-8') as f:
+            f.write(''.join(json.dumps(s) + '\n' for s in batch))
+
+    def stats(self, provider, model=None):
+        with self.lock:
+            samples = [
+                s for (p, m), q in self.samples.items() if p == provider and (model is None or m == model) for s in q
+            ]
+        if not samples:
+            return None
+
+        ok = [s for s in samples if s['status'] == 'ok']
+        result = {'count': len(samples), 'error_rate': 1 - len(ok) / len(samples)}
+        for field in FIELDS:
+            values = [s[field] for s in ok if s.get(field) is not None]
+            result[field] = {'p50': percentile(values, 50), 'p90': percentile(values, 90)}
+        return result
+
+    def keys(self):
+        with self.lock:
+            return sorted(self.samples)
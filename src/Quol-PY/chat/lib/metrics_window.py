@@ -0,0 +1,68 @@
+from PySide6.QtCore import QTimer
+from PySide6.QtWidgets import QAbstractItemView, QHeaderView, QTableWidget, QTableWidgetItem
+
+from qlib.windows.quol_window import QuolSubWindow
+
+COLUMNS = [
+    ('Provider', None, None),
+    ('Model', None, None),
+    ('N', None, None),
+    ('Err', None, None),
+    ('TTFT p50', 'ttft_ms', 'p50'),
+    ('TTFT p90', 'ttft_ms', 'p90'),
+    ('Total p50', 'total_ms', 'p50'),
+    ('Total p90', 'total_ms', 'p90'),
+    ('Tok/s', 'tokens_per_s', 'p50'),
+    ('Upload', 'upload_bytes', 'p50'),
+    ('Encode', 'encode_ms', 'p50'),
+    ('Capture', 'capture_ms', 'p50'),
+]
+
+
+def format_value(field, value):
+    if value is None:
+        return '-'
+    if field == 'upload_bytes':
+        return f'{value / 1024:.0f} KB'
+    if field == 'tokens_per_s':
+        return f'{value:.0f}'
+    return f'{value:.0f} ms'
+
+
+class MetricsWindow(QuolSubWindow):
+    def __init__(self, main_window):
+        super().__init__(main_window, 'Chat Metrics')
+        self.setGeometry(560, 200, 760, 220)
+        self.metrics = main_window.ai.metrics
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels([c[0] for c in COLUMNS])
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.layout.addWidget(self.table)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.refresh_timer.start()
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        keys = self.metrics.keys()
+        self.table.setRowCount(len(keys))
+
+        for row, (provider, model) in enumerate(keys):
+            stats = self.metrics.stats(provider, model)
+            values = [provider, model, str(stats['count']), f'{stats["error_rate"] * 100:.0f}%']
+            values += [format_value(field, stats[field][p]) for _, field, p in COLUMNS[4:]]
+
+            for col, value in enumerate(values):
+                self.table.setItem(row, col, QTableWidgetItem(value))
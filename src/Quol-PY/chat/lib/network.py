@@ -0,0 +1,234 @@
+import asyncio
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+from PySide6.QtCore import QObject, QThread, Signal
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+RETRY_STATUS = (429, 503)
+
+
+class RateLimited(Exception):
+    def __init__(self, message, retry_after=0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class NetworkWorker(QThread):
+    """Owns one asyncio loop and a pooled client per provider host, shared by every request."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.loop = None
+        self.clients = {}
+        self.jobs = set()
+        self._ready = threading.Event()
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._ready.set()
+
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self._close_clients())
+            self.loop.close()
+
+    def submit(self, job):
+        if not self.isRunning():
+            self.start()
+        self._ready.wait()
+
+        self.jobs.add(job)
+        job.future = asyncio.run_coroutine_threadsafe(job.run(self), self.loop)
+        job.future.add_done_callback(lambda _: self.jobs.discard(job))
+        return job.future
+
+    def client_for(self, url):
+        parts = urlsplit(url)
+        host = f'{parts.scheme}://{parts.netloc}'
+
+        if host not in self.clients:
+            self.clients[host] = httpx.AsyncClient(
+                http2=HTTP2,
+                timeout=httpx.Timeout(60.0, connect=30.0),
+                limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=120.0),
+            )
+        return self.clients[host]
+
+    async def _close_clients(self):
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+
+    def cancel(self, job):
+        job.cancel()
+        self.jobs.discard(job)
+
+    def stop(self):
+        if self.loop and self.isRunning():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.wait()
+
+
+class RequestJob(QObject):
+    delta_signal = Signal(str)
+    finished_signal = Signal(str)
+    error_signal = Signal(str)
+    rate_limited_signal = Signal(float)
+
+    def __init__(self, model_type, url, headers, data, stream=False, parent=None):
+        super().__init__(parent)
+        self.model_type = model_type
+        self.url = url
+        self.headers = headers
+        self.data = data
+        self.stream = stream
+        self.future = None
+        self.cancelled = False
+        self.started = 0
+        self.stats = {}
+        self.retries = 0
+        self.max_retries = 0
+        self.queued_at = 0
+
+    def cancel(self):
+        # cancelling the task exits the stream context, which closes the connection immediately
+        self.cancelled = True
+        if self.future:
+            self.future.cancel()
+
+    async def run(self, worker):
+        self.started = time.perf_counter()
+        self.stats = {'retries': self.retries} if self.retries else {}
+        try:
+            client = worker.client_for(self.url)
+            if self.stream:
+                text = await self._stream_request(client)
+            else:
+                text = await self._single_request(client)
+
+            self.stats['total_ms'] = self._elapsed_ms()
+            self.finished_signal.emit(text)
+
+        except RateLimited as e:
+            self.stats['total_ms'] = self._elapsed_ms()
+            if self.retries < self.max_retries:
+                self.retries += 1
+                self.rate_limited_signal.emit(e.retry_after)
+            else:
+                self.error_signal.emit(str(e))
+
+        except Exception as e:
+            self.stats['total_ms'] = self._elapsed_ms()
+            self.error_signal.emit(str(e))
+
+    def _elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def _body(self):
+        body = json.dumps(self.data).encode('utf-8')
+        self.stats['upload_bytes'] = len(body)
+        return body
+
+    def _on_delta(self, delta):
+        if 'ttft_ms' not in self.stats:
+            self.stats['ttft_ms'] = self._elapsed_ms()
+        self.delta_signal.emit(delta)
+
+    async def _single_request(self, client):
+        response = await client.post(self.url, headers=self.headers, content=self._body())
+        self.stats['http_status'] = response.status_code
+        if response.status_code in RETRY_STATUS:
+            raise RateLimited(self._error_message(response), self._retry_after(response))
+        res = response.json()
+
+        if 'error' in res:
+            raise Exception(res['error']['message'])
+
+        if self.model_type == 'gemini':
+            text = res['candidates'][0]['content']['parts'][0]['text']
+        elif self.model_type == 'groq':
+            text = res['choices'][0]['message']['content']
+        else:
+            raise Exception('Unknown model type')
+
+        self._parse_usage(res)
+        self._on_delta(text)
+        return text
+
+    async def _stream_request(self, client):
+        chunks = []
+
+        async with client.stream('POST', self.url, headers=self.headers, content=self._body()) as response:
+            self.stats['http_status'] = response.status_code
+            if response.status_code >= 400:
+                await response.aread()
+                if response.status_code in RETRY_STATUS:
+                    raise RateLimited(self._error_message(response), self._retry_after(response))
+                raise Exception(self._error_message(response))
+
+            async for line in response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+
+                payload = line[5:].strip()
+                if payload == '[DONE]':
+                    break
+
+                event = json.loads(payload)
+                if 'error' in event:
+                    raise Exception(event['error']['message'])
+
+                self._parse_usage(event)
+                delta = self._parse_delta(event)
+                if delta:
+                    chunks.append(delta)
+                    self._on_delta(delta)
+
+        return ''.join(chunks)
+
+    def _parse_delta(self, event):
+        if self.model_type == 'gemini':
+            candidates = event.get('candidates') or [{}]
+            parts = candidates[0].get('content', {}).get('parts', [])
+            return ''.join(p.get('text', '') for p in parts)
+        elif self.model_type == 'groq':
+            choices = event.get('choices') or [{}]
+            return choices[0].get('delta', {}).get('content') or ''
+        raise Exception('Unknown model type')
+
+    def _parse_usage(self, event):
+        if self.model_type == 'gemini':
+            tokens = event.get('usageMetadata', {}).get('candidatesTokenCount')
+        else:
+            usage = event.get('usage') or event.get('x_groq', {}).get('usage') or {}
+            tokens = usage.get('completion_tokens')
+        if tokens:
+            self.stats['output_tokens'] = tokens
+
+    @staticmethod
+    def _retry_after(response):
+        try:
+            return float(response.headers.get('retry-after', 0))
+        except ValueError:
+            return 0.0
+
+    @staticmethod
+    def _error_message(response):
+        try:
+            res = response.json()
+            if isinstance(res, list):
+                res = res[0]
+            return res['error']['message']
+        except Exception:
+            return f'HTTP {response.status_code}: {response.text}'
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """Disk-backed LRU of model answers, keyed by a digest of everything that was sent."""
+
+    def __init__(self, cache_dir, ttl=3600, max_bytes=5 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self._index = None
+
+    @property
+    def index(self):
+        # read on the first lookup, so an unused cache costs nothing at startup
+        if self._index is None:
+            self._index = OrderedDict()
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self._index = OrderedDict(json.load(f))
+            except (OSError, ValueError):
+                pass
+        return self._index
+
+    @staticmethod
+    def key(provider, model, prompt, history, image=None, summary=''):
+        digest = hashlib.sha256()
+        for h in history:
+            digest.update(h['role'].encode('utf-8') + b'\0' + h['text'].encode('utf-8') + b'\0')
+            if h.get('image'):
+                digest.update(h['image'].encode('utf-8'))
+
+        parts = {
+            'provider': provider,
+            'model': model,
+            'prompt': prompt,
+            'history': digest.hexdigest(),
+            'summary': summary,
+            'image': image.id if image else None,
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+
+        if time.time() - entry['created'] > self.ttl:
+            self._remove(key)
+            self._save_index()
+            return None
+
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            self._remove(key)
+            self._save_index()
+            return None
+
+        self.index.move_to_end(key)
+        self._save_index()
+        return text
+
+    def put(self, key, text):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        data = text.encode('utf-8')
+        with open(self._path(key), 'wb') as f:
+            f.write(data)
+
+        self.index[key] = {'created': time.time(), 'size': len(data)}
+        self.index.move_to_end(key)
+
+        total = sum(e['size'] for e in self.index.values())
+        while total > self.max_bytes and len(self.index) > 1:
+            oldest = next(iter(self.index))
+            total -= self.index[oldest]['size']
+            self._remove(oldest)
+
+        self._save_index()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.txt')
+
+    def _remove(self, key):
+        self.index.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _save_index(self):
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f)
@@ -0,0 +1,28 @@
+def provider_score(stats, auto_config):
+    latency = auto_config['default_ms']
+    error_rate = 0
+    if stats is not None:
+        error_rate = stats['error_rate']
+        if stats['total_ms']['p50'] is not None:
+            latency = stats['total_ms']['p50']
+
+    return latency * (1 + auto_config['error_penalty'] * error_rate)
+
+
+def rank_providers(metrics, config, has_image=False, exclude=()):
+    auto_config = config['auto']
+    ranked = []
+
+    for provider in auto_config['providers']:
+        provider_config = config[provider]
+        if provider in exclude:
+            continue
+        if 'apikey' in provider_config and not provider_config['apikey']:
+            continue
+        if has_image and not provider_config.get('vision', True):
+            continue
+
+        stats = metrics.stats(provider, provider_config['model'])
+        ranked.append((provider_score(stats, auto_config), provider))
+
+    return [provider for _, provider in sorted(ranked)]
@@ -0,0 +1,99 @@
+import random
+import time
+from collections import deque
+
+from PySide6.QtCore import Qt, QThread, QTimer
+
+
+class RequestScheduler:
+    """Starts jobs under a per-provider concurrency limit, queues the rest and backs off on rate limits."""
+
+    def __init__(self, config, launch):
+        self.config = config
+        self.launch = launch
+        self.queues = {}
+        self.running = {}
+        self.cooldown = {}
+
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.timer.timeout.connect(self.drain)
+
+    def limit(self, provider):
+        return self.config.get(provider, {}).get('concurrency', self.config['scheduler']['concurrency'])
+
+    def submit(self, job):
+        provider = job.model_type
+        job.max_retries = self.config['scheduler']['max_retries']
+        job.finished_signal.connect(lambda _: self.release(job))
+        job.error_signal.connect(lambda _: self.release(job))
+        job.rate_limited_signal.connect(lambda retry_after: self.on_rate_limited(job, retry_after))
+
+        queued = sum(len(q) for q in self.queues.values())
+        if queued >= self.config['scheduler']['max_queue']:
+            # the newest prompt matters most, so the oldest waiting job is dropped
+            oldest = min((q[0] for q in self.queues.values() if q), key=lambda j: j.queued_at)
+            self.queues[oldest.model_type].remove(oldest)
+            oldest.error_signal.emit('Dropped from a full request queue')
+
+        job.queued_at = time.monotonic()
+        self.queues.setdefault(provider, deque()).append(job)
+        self.drain()
+
+    def drain(self):
+        now = time.monotonic()
+        wake = None
+        for provider, queue in self.queues.items():
+            cooldown = self.cooldown.get(provider, 0)
+            if queue and cooldown > now:
+                wake = min(wake or cooldown, cooldown)
+                continue
+
+            running = self.running.setdefault(provider, set())
+            while queue and len(running) < self.limit(provider):
+                job = queue.popleft()
+                running.add(job)
+                self.launch(job)
+
+        if wake is not None:
+            self.timer.start(int((wake - now) * 1000) + 1)
+
+    def release(self, job):
+        self.running.get(job.model_type, set()).discard(job)
+        self.drain()
+
+    def cancel(self, job):
+        queue = self.queues.get(job.model_type)
+        if queue and job in queue:
+            queue.remove(job)
+        job.cancel()
+
+        if isinstance(job, QThread):
+            # a local request only notices the cancel between chunks, so its slot frees up once the thread returns
+            job.finished.connect(lambda: self.release(job))
+            if job.isRunning():
+                return
+        self.release(job)
+
+    def on_rate_limited(self, job, retry_after):
+        config = self.config['scheduler']
+        backoff = min(config['max_backoff'], config['backoff'] * 2 ** (job.retries - 1))
+        delay = max(retry_after, backoff * random.uniform(0.8, 1.2))
+        print(f'{job.model_type}: rate limited, retry {job.retries} in {delay:.1f}s')
+
+        # the whole provider cools down, not just this job, so queued prompts don't hit the limit too
+        self.cooldown[job.model_type] = time.monotonic() + delay
+        self.running.get(job.model_type, set()).discard(job)
+        self.queues.setdefault(job.model_type, deque()).appendleft(job)
+        self.drain()
+
+    def cancel_all(self):
+        for queue in self.queues.values():
+            for job in queue:
+                job.cancel()
+            queue.clear()
+        for running in self.running.values():
+            for job in running:
+                job.cancel()
+            running.clear()
@@ -0,0 +1,96 @@
+import base64
+import hashlib
+import time
+
+from PySide6.QtCore import QBuffer, QIODevice, QThread, Qt
+from PySide6.QtGui import QCursor, QGuiApplication, QImage, QImageWriter
+
+MIME_TYPES = {'png': 'image/png', 'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+
+
+class EncodedImage:
+    def __init__(self, data: bytes, fmt, width, height, encode_ms=0.0):
+        self.data = data
+        self.format = fmt
+        self.mime = MIME_TYPES[fmt]
+        self.width = width
+        self.height = height
+        self.encode_ms = encode_ms
+        self.id = hashlib.sha1(data).hexdigest()
+        self.signature = None
+        self.policy = None
+        self._base64 = None
+
+    def base64(self):
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode('utf-8')
+        return self._base64
+
+    def describe(self):
+        return f'{len(self.data) / 1024:.0f} KB {self.format} {self.width}x{self.height} ({self.encode_ms:.0f} ms)'
+
+
+def capture_screen(screen_mode='primary') -> QImage:
+    screen = None
+    if screen_mode == 'cursor':
+        screen = QGuiApplication.screenAt(QCursor.pos())
+    if not screen:
+        screen = QGuiApplication.primaryScreen()
+
+    return screen.grabWindow(0).toImage()
+
+
+def screen_signature(image: QImage) -> bytes:
+    # a digest of the raw pixels, so a capture is only reused when nothing at all has changed
+    digest = hashlib.sha1(f'{image.width()}x{image.height()}:{image.format()}'.encode())
+    digest.update(image.constBits())
+    return digest.digest()
+
+
+def supported_format(fmt):
+    fmt = fmt.lower()
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in MIME_TYPES:
+        return 'png'
+
+    if fmt.encode() not in [bytes(f).lower() for f in QImageWriter.supportedImageFormats()]:
+        return 'jpeg' if fmt == 'webp' else 'png'
+    return fmt
+
+
+def encode_image(image: QImage, fmt='png', quality=-1, max_edge=0) -> EncodedImage:
+    start = time.perf_counter()
+    fmt = supported_format(fmt)
+
+    if max_edge and max(image.width(), image.height()) > max_edge:
+        image = image.scaled(
+            max_edge, max_edge, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation
+        )
+
+    if fmt == 'jpeg' and image.hasAlphaChannel():
+        image = image.convertToFormat(QImage.Format.Format_RGB888)
+
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, fmt.upper(), quality if fmt != 'png' else -1)
+
+    return EncodedImage(
+        bytes(buffer.data()), fmt, image.width(), image.height(), (time.perf_counter() - start) * 1000
+    )
+
+
+class EncodeThread(QThread):
+    """Encodes a captured screen off the GUI thread so the payload is ready before the prompt is sent."""
+
+    def __init__(self, image: QImage, policy, parent=None):
+        super().__init__(parent)
+        self.image = image
+        self.policy = policy
+        self.result = None
+
+    def run(self):
+        result = encode_image(self.image, self.policy['format'], self.policy['quality'], self.policy['max_edge'])
+        result.signature = screen_signature(self.image)
+        result.policy = self.policy
+        self.result = result
@@ -1,71 +1,254 @@
+import threading
+import time
+
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import StaleElementReferenceException, NoSuchElementException
+from selenium.common.exceptions import StaleElementReferenceException
 from selenium.webdriver.support.wait import WebDriverWait
 from seleniumbase import Driver
 
 MAX_RETRIES = 3
+POLL_TIMEOUT = 1
+SHARED_POLL_TIMEOUT = 0.2
+TAB_TIMEOUT = 60
+CANCEL_CHECK = 0.2
+RESPONSE_TIMEOUT = 300
+
+# watches the newest .markdown block and queues text deltas plus a final 'done' event with its html
+OBSERVE_SCRIPT = '''
+const start = arguments[0];
+const stopSelector = '[aria-label="Stop streaming"], [data-testid="stop-button"]';
+const state = window.__quol = {queue: [], text: '', streaming: false, done: false, wake: null, idle: null};
+
+const push = (event) => {
+    state.queue.push(event);
+    if (state.wake) {
+        const wake = state.wake;
+        state.wake = null;
+        wake(state.queue.splice(0));
+    }
+};
+
+const finish = (node) => {
+    if (state.done) return;
+    state.done = true;
+    state.observer.disconnect();
+    push({type: 'done', html: node.outerHTML});
+};
+
+const check = () => {
+    if (state.done) return;
+    const nodes = document.getElementsByClassName('markdown');
+    const node = nodes.length > start ? nodes[nodes.length - 1] : null;
+    const streaming = !!document.querySelector(stopSelector);
+    state.streaming = state.streaming || streaming;
+
+    if (node) {
+        const text = node.innerText;
+        if (text !== state.text) {
+            if (text.startsWith(state.text)) {
+                push({type: 'delta', text: text.slice(state.text.length)});
+            } else {
+                push({type: 'reset', text: text});
+            }
+            state.text = text;
+        }
+    }
+
+    clearTimeout(state.idle);
+    if (node && !streaming) {
+        // short answers can finish before the stop button is ever seen, so quiet time also counts as done
+        state.idle = setTimeout(() => finish(node), state.streaming ? 0 : 1500);
+    }
+};
+
+state.observer = new MutationObserver(check);
+state.observer.observe(document.body, {
+    childList: true, subtree: true, characterData: true, attributes: true, attributeFilter: ['aria-label', 'data-testid']
+});
+'''
+
+# resolves as soon as the observer queues something, or with nothing after the timeout
+POLL_SCRIPT = '''
+const timeout = arguments[0];
+const done = arguments[arguments.length - 1];
+const state = window.__quol;
+if (!state) {
+    done([{type: 'error', text: 'Response observer is missing.'}]);
+    return;
+}
+if (state.queue.length) {
+    done(state.queue.splice(0));
+    return;
+}
+const timer = setTimeout(() => {
+    state.wake = null;
+    done([]);
+}, timeout);
+state.wake = (events) => {
+    clearTimeout(timer);
+    done(events);
+};
+'''
 
 
 class Simulator:
-    def __init__(self):
+    """One persistent browser session with a pool of tabs; every driver call is serialized through a lock."""
+
+    def __init__(self, profile_dir=None, tabs=1):
         self.driver = None
         self.responses = []
         self.use = 'chatgpt'
+        self.headless = True
         self.is_loaded = False
 
-    def reload(self, use, headless=True):
-        if self.driver:
-            try:
-                self.driver.quit()
-            except Exception as e:
-                print('Error quitting driver:', e)
+        self.profile_dir = profile_dir
+        self.tab_count = max(1, tabs)
+        self.tabs = []
+        self.free_tabs = []
+        self.lock = threading.RLock()
+        self.tab_ready = threading.Condition(self.lock)
 
-        self.driver = Driver(uc=True, headless=headless, disable_csp=True)
-        self.use = use
-        self.is_loaded = False
-        self.responses = []
+    def url(self):
+        return 'https://chat.openai.com/' if self.use == 'chatgpt' else 'https://grok.com'
 
-        if self.use == 'chatgpt':
-            self.driver.uc_open('https://chat.openai.com/')
+    def is_alive(self):
+        try:
+            return self.driver is not None and bool(self.driver.window_handles)
+        except Exception:
+            return False
 
-            if self.driver.is_element_visible('[data-testid="close-button"]'):
+    def reload(self, use, headless=True):
+        with self.lock:
+            if use == self.use and headless == self.headless and self.is_alive():
+                # the browser and its logged in profile are kept, only the conversations start over
+                self.refresh()
+                return
+
+            self.close()
+            self.driver = Driver(uc=True, headless=headless, disable_csp=True, user_data_dir=self.profile_dir)
+            self.driver.set_script_timeout(POLL_TIMEOUT + 5)
+            self.use = use
+            self.headless = headless
+            self.responses = []
+
+            self.driver.uc_open(self.url())
+            if self.use == 'chatgpt' and self.driver.is_element_visible('[data-testid="close-button"]'):
                 self.driver.find_element(By.CSS_SELECTOR, '[data-testid="close-button"]').click()
 
-        elif self.use == 'grok':
-            self.driver.uc_open('https://grok.com')
+            self.tabs = [self.driver.current_window_handle]
+            for _ in range(self.tab_count - 1):
+                self.driver.switch_to.new_window('tab')
+                self.driver.get(self.url())
+                self.tabs.append(self.driver.current_window_handle)
+
+            self.free_tabs = list(self.tabs)
+            self.is_loaded = True
+            self.tab_ready.notify_all()
 
-        self.is_loaded = True
         print('AI loaded')
 
     def refresh(self):
-        try:
-            if self.driver:
-                self.driver.refresh()
+        with self.lock:
+            try:
+                for tab in self.tabs:
+                    self.driver.switch_to.window(tab)
+                    self.driver.refresh()
                 self.responses = []
-        except Exception as e:
-            print('Error refreshing, reloading:', e)
-            self.reload(self.use)
+            except Exception as e:
+                print('Error refreshing, reloading:', e)
+                # quit the old browser first, it holds the lock on the persistent profile
+                self.close()
+                self.reload(self.use, self.headless)
 
     def close(self):
-        self.is_loaded = False
-        if self.driver:
-            try:
-                self.driver.quit()
-            except Exception as e:
-                print('Error quitting driver:', e)
-            self.driver = None
+        with self.lock:
+            self.is_loaded = False
+            if self.driver:
+                try:
+                    self.driver.quit()
+                except Exception as e:
+                    print('Error quitting driver:', e)
+                self.driver = None
+
+            self.tabs = []
+            self.free_tabs = []
+            self.tab_ready.notify_all()
+
+    def acquire_tab(self, cancel):
+        deadline = time.monotonic() + TAB_TIMEOUT
+        with self.tab_ready:
+            # waits in short steps so a cancelled prompt stops queueing for a tab
+            while not cancel.is_set() and time.monotonic() < deadline:
+                if self.tab_ready.wait_for(lambda: self.free_tabs or not self.is_loaded, timeout=CANCEL_CHECK):
+                    break
+            if cancel.is_set() or not self.free_tabs:
+                return None
+            # last in, first out, so prompts sent one after another stay in the same conversation
+            return self.free_tabs.pop()
 
-    def submit(self, msg, img_path=None):
+    def release_tab(self, tab):
+        with self.tab_ready:
+            if tab in self.tabs and tab not in self.free_tabs:
+                self.free_tabs.append(tab)
+            self.tab_ready.notify()
+
+    def submit(self, msg, img_path=None, cancel=None):
         if not self.driver:
-            return 'Error: AI not loaded.'
+            return iter([{'type': 'error', 'text': 'AI not loaded.'}])
 
+        cancel = cancel or threading.Event()
         if self.use == 'chatgpt':
-            return self.gpt(msg, img_path)
+            return self.gpt(msg, img_path, cancel)
         elif self.use == 'grok':
             return self.grok(msg, img_path)
 
-    def gpt(self, msg, img_path=None) -> str:
+    def gpt(self, msg, img_path, cancel):
+        tab = self.acquire_tab(cancel)
+        if tab is None:
+            if not cancel.is_set():
+                yield {'type': 'error', 'text': 'No browser tab is free.'}
+            return
+
+        try:
+            with self.lock:
+                if not self.send_prompt(tab, msg, img_path):
+                    yield {'type': 'error', 'text': 'Unable to submit the prompt.'}
+                    return
+
+            deadline = time.monotonic() + RESPONSE_TIMEOUT
+            while time.monotonic() < deadline:
+                if cancel.is_set():
+                    return
+
+                with self.lock:
+                    # a long wait would hold the driver, so it is only used while no other tab is busy
+                    shared = len(self.free_tabs) < len(self.tabs) - 1
+                    timeout = SHARED_POLL_TIMEOUT if shared else POLL_TIMEOUT
+                    self.driver.switch_to.window(tab)
+                    events = self.driver.execute_async_script(POLL_SCRIPT, int(timeout * 1000))
+
+                if shared:
+                    # the lock isn't fair, so step aside long enough for the other tabs to get a turn
+                    time.sleep(0.01)
+
+                for event in events:
+                    yield event
+
+                    if event['type'] == 'done':
+                        self.responses.append(event['html'])
+                        return
+                    if event['type'] == 'error':
+                        return
+
+            yield {'type': 'error', 'text': 'Timed out waiting for the response.'}
+
+        finally:
+            self.release_tab(tab)
+
+    def send_prompt(self, tab, msg, img_path=None):
+        self.driver.switch_to.window(tab)
+
         text_input = self.driver.find_element(By.CLASS_NAME, 'ProseMirror')
         text_input.send_keys(msg)
 
@@ -75,51 +258,22 @@ class Simulator:
 
         wait = WebDriverWait(self.driver, 30)
 
+        # the observer goes in before the click so the first tokens can't be missed
+        start = len(self.driver.find_elements(By.CLASS_NAME, 'markdown'))
+        self.driver.execute_script(OBSERVE_SCRIPT, start)
+
         for attempt in range(MAX_RETRIES):
             try:
                 # print(f"Looking for submit button (attempt {attempt + 1})...")
                 button = wait.until(EC.element_to_be_clickable((By.ID, "composer-submit-button")))
                 button.click()
-                break
+                return True
             except StaleElementReferenceException:
                 # print(f"StaleElementReferenceException on attempt {attempt + 1}, retrying...")
                 continue
-        else:
-            # print("Failed to click the submit button after retries.")
-            return 'Error: Unable to submit the prompt.'
-
-        # print('Waiting for ".markdown" tag...')
-        wait.until(EC.presence_of_element_located((By.CLASS_NAME, 'markdown')))
 
-        while True:
-            try:
-                latest = self.driver.find_elements(By.CLASS_NAME, 'markdown')[-1]
-                yield latest.get_attribute('outerHTML')
-            except (StaleElementReferenceException, NoSuchElementException):
-                # print('Element error (stale or missing), retrying...')
-                continue
-            except Exception as e:
-                # print('Unexpected error:', e)
-                continue
-
-            try:
-                # print('Waiting for response stream to complete...')
-                self.driver.find_element(By.CSS_SELECTOR, '[aria-label="Stop streaming"]')
-            except NoSuchElementException:
-                # print('No stop button found, assuming response complete.')
-                break
-
-        # print('Response received, processing...')
-
-        try:
-            last_response = self.driver.find_elements(By.CLASS_NAME, 'markdown')[-1].get_attribute('outerHTML')
-            self.responses.append(last_response)
-            yield last_response
-        except Exception as e:
-            # print("Failed to capture final response:", e)
-            return 'Error: Unable to capture final response.'
-
-        # print('Final response processing complete.')
+        # print("Failed to click the submit button after retries.")
+        return False
 
     def grok(self, msg, img_path=None):
         return ''
@@ -1,4 +1,4 @@
-from PySide6.QtCore import QPoint, QRect, Qt
+from PySide6.QtCore import QPoint, QRect, QRectF, Qt
 from PySide6.QtGui import QColor, QPainter, QPen, QPixmap
 from PySide6.QtWidgets import QPushButton, QWidget
 
@@ -13,6 +13,7 @@ class SnipOverlay(QWidget):
         self.end_point = QPoint()
         self.selection_rect = QRect()
         self.is_selecting = False
+        self.dimmed = None
 
         self.setWindowFlags(
             Qt.WindowType.FramelessWindowHint
@@ -29,6 +30,24 @@ class SnipOverlay(QWidget):
             'background-color: #4CAF50; color: white; padding: 4px 10px; border-radius: 6px;'
         )
 
+    def _build_dimmed(self):
+        # the dimmed screen never changes while selecting, so it is painted once per size
+        dpr = self.devicePixelRatioF()
+        self.dimmed = QPixmap(round(self.width() * dpr), round(self.height() * dpr))
+        self.dimmed.setDevicePixelRatio(dpr)
+
+        painter = QPainter(self.dimmed)
+        painter.drawPixmap(self.rect(), self.screenshot)
+        painter.fillRect(self.rect(), QColor(0, 0, 0, 60))
+        painter.end()
+
+    def _update_selection(self, rect):
+        # only the area under the old and new selection (plus the border) needs repainting
+        dirty = self.selection_rect.united(rect) if not self.selection_rect.isNull() else rect
+        self.selection_rect = rect
+        if not dirty.isNull():
+            self.update(dirty.adjusted(-2, -2, 2, 2))
+
     def _selection_to_screenshot_rect(self) -> QRect:
         if self.selection_rect.isNull() or self.width() <= 0 or self.height() <= 0:
             return QRect()
@@ -50,17 +69,15 @@ class SnipOverlay(QWidget):
         self.is_selecting = True
         self.start_point = event.position().toPoint()
         self.end_point = self.start_point
-        self.selection_rect = QRect()
         self.send_btn.hide()
-        self.update()
+        self._update_selection(QRect())
 
     def mouseMoveEvent(self, event):
         if not self.is_selecting:
             return
 
         self.end_point = event.position().toPoint()
-        self.selection_rect = QRect(self.start_point, self.end_point).normalized().intersected(self.rect())
-        self.update()
+        self._update_selection(QRect(self.start_point, self.end_point).normalized().intersected(self.rect()))
 
     def mouseReleaseEvent(self, event):
         if event.button() != Qt.MouseButton.LeftButton:
@@ -68,18 +85,16 @@ class SnipOverlay(QWidget):
 
         self.is_selecting = False
         self.end_point = event.position().toPoint()
-        self.selection_rect = QRect(self.start_point, self.end_point).normalized().intersected(self.rect())
+        self._update_selection(QRect(self.start_point, self.end_point).normalized().intersected(self.rect()))
 
         if self.selection_rect.width() < 8 or self.selection_rect.height() < 8:
-            self.selection_rect = QRect()
             self.send_btn.hide()
-            self.update()
+            self._update_selection(QRect())
             return
 
         self._place_send_button()
         self.send_btn.show()
         self.send_btn.raise_()
-        self.update()
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key.Key_Escape:
@@ -87,17 +102,29 @@ class SnipOverlay(QWidget):
             return
         super().keyPressEvent(event)
 
+    def resizeEvent(self, event):
+        self.dimmed = None
+        super().resizeEvent(event)
+
     def paintEvent(self, event):
-        painter = QPainter(self)
-        painter.drawPixmap(self.rect(), self.screenshot)
+        if self.dimmed is None or self.dimmed.deviceIndependentSize().toSize() != self.size():
+            self._build_dimmed()
 
-        painter.fillRect(self.rect(), QColor(0, 0, 0, 60))
+        painter = QPainter(self)
+        dirty = event.rect()
+        dpr = self.dimmed.devicePixelRatio()
+        painter.drawPixmap(
+            QRectF(dirty), self.dimmed,
+            QRectF(dirty.x() * dpr, dirty.y() * dpr, dirty.width() * dpr, dirty.height() * dpr)
+        )
 
         if not self.selection_rect.isNull():
-            screenshot_rect = self._selection_to_screenshot_rect()
-            if not screenshot_rect.isNull():
-                cropped = self.screenshot.copy(screenshot_rect)
-                painter.drawPixmap(self.selection_rect, cropped)
+            # drawn straight from the source pixmap instead of copying a crop on every move
+            sx = self.screenshot.width() / self.width()
+            sy = self.screenshot.height() / self.height()
+            rect = QRectF(self.selection_rect)
+            source = QRectF(rect.x() * sx, rect.y() * sy, rect.width() * sx, rect.height() * sy)
+            painter.drawPixmap(rect, self.screenshot, source)
 
             pen = QPen(QColor(80, 190, 255), 2)
             painter.setPen(pen)
@@ -0,0 +1,206 @@
+import queue
+import sqlite3
+import threading
+import time
+
+from lib.screenshot import EncodedImage
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    title TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS images (
+    id TEXT PRIMARY KEY,
+    format TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    conversation_id INTEGER NOT NULL REFERENCES conversations(id),
+    role TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT,
+    text TEXT NOT NULL,
+    image_id TEXT REFERENCES images(id),
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_conversation ON turns(conversation_id, id);
+CREATE INDEX IF NOT EXISTS conversations_updated ON conversations(updated_at);
+'''
+
+FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(text, content='turns', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS turns_ai AFTER INSERT ON turns BEGIN
+    INSERT INTO turns_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS turns_ad AFTER DELETE ON turns BEGIN
+    INSERT INTO turns_fts(turns_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+'''
+
+
+class ConversationStore:
+    """SQLite history of every turn. Writes go through a background thread so the GUI never waits on a commit."""
+
+    def __init__(self, path, save_images=False, max_image_bytes=50 * 1024 * 1024, max_image_days=7):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        self.save_images = save_images
+        self.max_image_bytes = max_image_bytes
+        self.max_image_days = max_image_days
+
+        with self.lock:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.executescript(SCHEMA)
+
+            try:
+                self.db.executescript(FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                self.has_fts = False
+            self.db.commit()
+
+            # ids are handed out here so a new conversation doesn't wait for its insert
+            self.last_conversation_id = self.db.execute('SELECT COALESCE(MAX(id), 0) FROM conversations').fetchone()[0]
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def new_conversation(self, title=''):
+        self.last_conversation_id += 1
+        self.queue.put((self._insert_conversation, (self.last_conversation_id, time.time(), title[:120])))
+        return self.last_conversation_id
+
+    def add_turn(self, conversation_id, role, provider, model, text, image=None):
+        # without save_images a turn only keeps the image digest, the bytes stay in memory for the session
+        self.queue.put((self._insert_turn, (
+            conversation_id, role, provider, model, text, image.id if image else None,
+            image if image and self.save_images else None, time.time()
+        )))
+
+    def _insert_conversation(self, conversation_id, now, title):
+        self.db.execute(
+            'INSERT INTO conversations (id, started_at, updated_at, title) VALUES (?, ?, ?, ?)',
+            (conversation_id, now, now, title)
+        )
+
+    def _insert_turn(self, conversation_id, role, provider, model, text, image_id, image, now):
+        if image:
+            self.db.execute(
+                'INSERT OR IGNORE INTO images (id, format, width, height, data) VALUES (?, ?, ?, ?, ?)',
+                (image.id, image.format, image.width, image.height, image.data)
+            )
+
+        self.db.execute(
+            'INSERT INTO turns (conversation_id, role, provider, model, text, image_id, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (conversation_id, role, provider, model, text, image_id, now)
+        )
+        self.db.execute('UPDATE conversations SET updated_at = ? WHERE id = ?', (now, conversation_id))
+
+        if image:
+            self._prune_images(now)
+
+    def _prune_images(self, now):
+        rows = self.db.execute(
+            'SELECT i.id, LENGTH(i.data) AS size, '
+            '(SELECT MAX(t.created_at) FROM turns t WHERE t.image_id = i.id) AS used_at '
+            'FROM images i ORDER BY used_at DESC'
+        ).fetchall()
+
+        expired = []
+        total = 0
+        for row in rows:
+            total += row['size']
+            if (row['used_at'] or 0) < now - self.max_image_days * 86400 or total > self.max_image_bytes:
+                expired.append((row['id'],))
+        # turns keep the dangling digest, load_image just returns None for it
+        self.db.executemany('DELETE FROM images WHERE id = ?', expired)
+
+    def _run(self):
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            try:
+                while True:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if None in batch:
+                running = False
+                batch = [w for w in batch if w is not None]
+
+            # one commit per batch, a burst of turns costs a single fsync
+            try:
+                with self.lock, self.db:
+                    for write, args in batch:
+                        write(*args)
+            except sqlite3.Error as e:
+                print('Error writing chat history:', e)
+
+    def recent_conversations(self, limit=50, offset=0):
+        with self.lock:
+            return self.db.execute(
+                'SELECT c.id AS conversation_id, c.updated_at, c.title AS snippet, '
+                '(SELECT provider FROM turns t WHERE t.conversation_id = c.id ORDER BY t.id DESC LIMIT 1) AS provider '
+                'FROM conversations c ORDER BY c.updated_at DESC LIMIT ? OFFSET ?',
+                (limit, offset)
+            ).fetchall()
+
+    def search(self, query, limit=50):
+        with self.lock:
+            if self.has_fts:
+                match = ' '.join('"' + term.replace('"', '""') + '"*' for term in query.split())
+                return self.db.execute(
+                    'SELECT conversation_id, MAX(created_at) AS updated_at, provider, snippet FROM ('
+                    "SELECT t.conversation_id, t.created_at, t.provider, snippet(turns_fts, 0, '<b>', '</b>', '...', 12) AS snippet "
+                    'FROM turns_fts JOIN turns t ON t.id = turns_fts.rowid WHERE turns_fts MATCH ? LIMIT 1000'
+                    ') GROUP BY conversation_id ORDER BY updated_at DESC LIMIT ?',
+                    (match, limit)
+                ).fetchall()
+
+            return self.db.execute(
+                'SELECT conversation_id, MAX(created_at) AS updated_at, provider, text AS snippet FROM turns '
+                'WHERE text LIKE ? GROUP BY conversation_id ORDER BY updated_at DESC LIMIT ?',
+                (f'%{query}%', limit)
+            ).fetchall()
+
+    def load_turns(self, conversation_id, offset=0, limit=20):
+        with self.lock:
+            return self.db.execute(
+                'SELECT id, role, provider, model, text, image_id, created_at FROM turns '
+                'WHERE conversation_id = ? ORDER BY id LIMIT ? OFFSET ?',
+                (conversation_id, limit, offset)
+            ).fetchall()
+
+    def last_turns(self, conversation_id, limit):
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT id, role, provider, model, text, image_id, created_at FROM turns '
+                'WHERE conversation_id = ? ORDER BY id DESC LIMIT ?',
+                (conversation_id, limit)
+            ).fetchall()
+        return rows[::-1]
+
+    def load_image(self, image_id):
+        with self.lock:
+            row = self.db.execute('SELECT format, width, height, data FROM images WHERE id = ?', (image_id,)).fetchone()
+        if row is None:
+            return None
+        return EncodedImage(row['data'], row['format'], row['width'], row['height'])
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+        with self.lock:
+            self.db.close()
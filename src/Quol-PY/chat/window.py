@@ -1,11 +1,17 @@
 import re
+import time
+
+from PySide6.QtCore import QEvent, Qt
 from PySide6.QtGui import QGuiApplication, QIcon
 from PySide6.QtWidgets import QPushButton, QComboBox, QLineEdit, QHBoxLayout
 
 from qlib.windows.quol_window import QuolMainWindow
 from qlib.windows.tool_loader import ToolSpec
 from lib.chat_window import ChatWindow
+from lib.history_window import HistoryWindow
+from lib.metrics_window import MetricsWindow
 from lib.ai import AI
+from lib.screenshot import EncodeThread, capture_screen, encode_image, screen_signature
 from lib.snip_overlay import SnipOverlay
 
 
@@ -23,7 +29,14 @@ class MainWindow(QuolMainWindow):
 
         self.ai = AI(self, self.chat_window)
         self.ai_list = QComboBox()
-        self.ai_list.addItems(['groq', 'gemini', 'ollama'])
+        self.ai_list.addItems(['groq', 'gemini', 'ollama', 'fanout', 'auto'])
+
+        # the browser provider needs seleniumbase, so it is only imported when turned on
+        self.gpt_window = None
+        if self.config['gpt']['enabled']:
+            from lib.gpt_window import GPTWindow
+            self.gpt_window = GPTWindow(self)
+            self.ai_list.addItem('gpt')
 
         self.ai_list_cycle_icon = QIcon(self.tool_spec.path + "/res/img/cycle.svg")
         self.ai_list_cycle_btn = QPushButton(self)
@@ -45,6 +58,28 @@ class MainWindow(QuolMainWindow):
         self.snip_btn.setIcon(self.snip_icon)
         self.snip_btn.setStyleSheet("padding-left: 5px; padding-right: 5px;")
         self.snip_overlay = None
+        self.image_data = None
+        self.encode_ms = 0.0
+        self.prefetch_thread = None
+        self.prefetched_at = 0
+
+        self.stop_icon = QIcon(self.tool_spec.path + "/res/img/stop.svg")
+        self.stop_btn = QPushButton(self)
+        self.stop_btn.setIcon(self.stop_icon)
+        self.stop_btn.setStyleSheet("padding-left: 5px; padding-right: 5px;")
+        self.stop_btn.setVisible(False)
+
+        self.history_icon = QIcon(self.tool_spec.path + "/res/img/history.svg")
+        self.history_btn = QPushButton(self)
+        self.history_btn.setIcon(self.history_icon)
+        self.history_btn.setStyleSheet("padding-left: 5px; padding-right: 5px;")
+        self.history_window = None
+
+        self.metrics_icon = QIcon(self.tool_spec.path + "/res/img/metrics.svg")
+        self.metrics_btn = QPushButton(self)
+        self.metrics_btn.setIcon(self.metrics_icon)
+        self.metrics_btn.setStyleSheet("padding-left: 5px; padding-right: 5px;")
+        self.metrics_window = None
 
         self.prompt_layout = QHBoxLayout()
 
@@ -52,11 +87,31 @@ class MainWindow(QuolMainWindow):
         self.prompt_layout.addWidget(self.prompt)
         self.prompt_layout.addWidget(self.img_btn)
         self.prompt_layout.addWidget(self.snip_btn)
+        self.prompt_layout.addWidget(self.stop_btn)
+        self.prompt_layout.addWidget(self.history_btn)
+        self.prompt_layout.addWidget(self.metrics_btn)
         self.layout.addLayout(self.prompt_layout)
 
         self.ai_list_cycle_btn.clicked.connect(self.on_cycle)
         self.snip_btn.clicked.connect(self.on_snip)
+        self.stop_btn.clicked.connect(self.ai.stop)
+        self.history_btn.clicked.connect(self.on_history)
+        self.metrics_btn.clicked.connect(self.on_metrics)
         self.prompt.returnPressed.connect(self.send_prompt)
+        self.prompt.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if obj is self.prompt and event.type() == QEvent.Type.FocusIn:
+            self.warm_up_provider()
+            self.prefetch_image()
+        elif obj is self.prompt and event.type() == QEvent.Type.KeyPress and event.key() == Qt.Key.Key_Escape:
+            self.ai.stop()
+        return super().eventFilter(obj, event)
+
+    def warm_up_provider(self):
+        provider = self.ai_list.currentText()
+        if provider == 'ollama' or (provider in ('fanout', 'auto') and 'ollama' in self.config[provider]['providers']):
+            self.ai.warm_ollama()
 
     def on_update_config(self):
         self.chat_window.close()
@@ -65,7 +120,17 @@ class MainWindow(QuolMainWindow):
         current_index = self.ai_list.currentIndex()
         next_index = (current_index + 1) % self.ai_list.count()
         self.ai_list.setCurrentIndex(next_index)
-        self.prompt.setPlaceholderText(f'Prompt for {self.ai_list.currentText()}...')
+        self.update_placeholder()
+        self.warm_up_provider()
+
+    def update_placeholder(self):
+        provider = self.ai_list.currentText()
+        status = ''
+        if provider == 'ollama' and self.ai.ollama_status:
+            status = f' ({self.ai.ollama_status})'
+        elif provider == 'auto' and self.ai.auto_provider:
+            status = f' ({self.ai.auto_provider})'
+        self.prompt.setPlaceholderText(f'Prompt for {provider}{status}...')
 
     def on_image(self):
         if self.img_btn.isChecked():
@@ -87,11 +152,23 @@ class MainWindow(QuolMainWindow):
         self.snip_overlay.raise_()
         self.snip_overlay.activateWindow()
 
+    def on_history(self):
+        if self.history_window is None:
+            self.history_window = HistoryWindow(self)
+        self.history_window.show()
+        self.history_window.raise_()
+
+    def on_metrics(self):
+        if self.metrics_window is None:
+            self.metrics_window = MetricsWindow(self)
+        self.metrics_window.show()
+        self.metrics_window.raise_()
+
     def on_snip_selected(self, cropped):
         if cropped.isNull():
             return
 
-        cropped.toImage().save(self.tool_spec.path + '/res/img/screenshot.png')
+        self.set_image(cropped.toImage())
 
         self.img_btn.setChecked(True)
         self.on_image()
@@ -102,19 +179,85 @@ class MainWindow(QuolMainWindow):
         self.send_prompt(use_existing_image=True)
 
     def send_prompt(self, use_existing_image=False):
+        if self.ai_list.currentText() == 'gpt':
+            self.start_chat()
+            return
+
         self.ai.is_img = self.img_btn.isChecked()
         self.ai.is_hist = self.config['config']['history']
+        self.ai.is_stream = self.config['config']['stream']
 
+        if self.prefetch_thread is not None:
+            self.prefetch_thread.wait()
+            self.on_prefetched()
+
+        capture_ms = 0.0
         if self.img_btn.isChecked() and not use_existing_image:
-            screen = QGuiApplication.primaryScreen()
+            start = time.perf_counter()
             self.tool_spec.toggle_instant_signal.emit(False)
-            screenshot = screen.grabWindow(0).toImage()
+            screenshot = capture_screen(self.config['image']['screen'])
             self.tool_spec.toggle_instant_signal.emit(True)
-            screenshot.save(self.tool_spec.path + '/res/img/screenshot.png')
+            capture_ms = (time.perf_counter() - start) * 1000
+            self.set_image(screenshot)
+
+        if self.img_btn.isChecked():
+            self.ai.timing = {'capture_ms': capture_ms, 'encode_ms': self.encode_ms}
+        else:
+            self.ai.timing = {}
+        self.encode_ms = 0.0
 
         self.set_button_loading_state(True)
         self.start_chat()
 
+    def prefetch_image(self):
+        if not self.config['image']['speculative'] or not self.img_btn.isChecked():
+            return
+        if self.prefetch_thread is not None or time.monotonic() - self.prefetched_at < 2:
+            return
+
+        self.prefetched_at = time.monotonic()
+        self.tool_spec.toggle_instant_signal.emit(False)
+        screenshot = capture_screen(self.config['image']['screen'])
+        self.tool_spec.toggle_instant_signal.emit(True)
+
+        self.prefetch_thread = EncodeThread(screenshot, self.image_policy(self.ai_list.currentText()))
+        self.prefetch_thread.finished.connect(self.on_prefetched)
+        self.prefetch_thread.start()
+
+    def on_prefetched(self):
+        thread, self.prefetch_thread = self.prefetch_thread, None
+        if thread is None or thread.result is None:
+            return
+
+        # the capture on Enter is compared against this and reused when the screen has not changed
+        self.image_data = thread.result
+        print('Image: prefetched', self.image_data.describe())
+
+    def set_image(self, image):
+        policy = self.image_policy(self.ai_list.currentText())
+        signature = screen_signature(image)
+
+        previous = self.image_data
+        if previous and previous.policy == policy and previous.signature == signature:
+            print('Image: unchanged, reusing', previous.id[:8])
+            self.encode_ms = 0.0
+            return
+
+        self.image_data = encode_image(image, policy['format'], policy['quality'], policy['max_edge'])
+        self.image_data.signature = signature
+        self.image_data.policy = policy
+        self.encode_ms = self.image_data.encode_ms
+        print('Image:', self.image_data.describe())
+
+        if self.config['config']['debug']:
+            with open(self.tool_spec.path + f'/res/img/screenshot.{self.image_data.format}', 'wb') as f:
+                f.write(self.image_data.data)
+
+    def image_policy(self, provider):
+        policy = dict(self.config['image'])
+        policy.update(self.config.get(provider, {}).get('image', {}))
+        return policy
+
     def start_chat(self):
         s = self.prompt.text().split()
         t = self.prompt.text()
@@ -128,13 +271,27 @@ class MainWindow(QuolMainWindow):
 
         print('Question:', t)
 
-        if self.ai_list.currentText() == 'ollama':
-            self.ai.prompt('ollama', {'prompt': t, 'model': self.config['ollama']['model']})
+        if self.ai_list.currentText() == 'fanout':
+            data = {
+                'prompt': t,
+                'model': 'fanout',
+                'providers': self.config['fanout']['providers'],
+                'mode': self.config['fanout']['mode'],
+                'image': self.image_data
+            }
+            self.ai.prompt('fanout', data)
+        elif self.ai_list.currentText() == 'gpt':
+            self.gpt_window.on_send(t, self.img_btn.isChecked())
+        elif self.ai_list.currentText() == 'auto':
+            self.ai.prompt('auto', {'prompt': t, 'model': 'auto', 'image': self.image_data})
+        elif self.ai_list.currentText() == 'ollama':
+            self.ai.prompt('ollama', {'prompt': t, 'model': self.config['ollama']['model'], 'image': self.image_data})
         else:
             data = {
                 'prompt': t,
                 'model': self.config[self.ai_list.currentText()]['model'],
-                'apikey': self.config[self.ai_list.currentText()]['apikey']
+                'apikey': self.config[self.ai_list.currentText()]['apikey'],
+                'image': self.image_data
             }
             self.ai.prompt(self.ai_list.currentText(), data)
 
@@ -145,8 +302,17 @@ class MainWindow(QuolMainWindow):
             self.snip_btn.setEnabled(False)
         else:
             self.snip_btn.setEnabled(True)
+        self.stop_btn.setVisible(is_loading)
 
     def closeEvent(self, event):
         self.chat_window.close()
-        # self.gpt.close()
+        if self.prefetch_thread is not None:
+            self.prefetch_thread.wait()
+        if self.history_window:
+            self.history_window.close()
+        if self.metrics_window:
+            self.metrics_window.close()
+        self.ai.close()
+        if self.gpt_window:
+            self.gpt_window.shutdown()
         super().closeEvent(event)
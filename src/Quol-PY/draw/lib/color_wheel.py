@@ -1,9 +1,60 @@
 import math
 
 from PySide6.QtCore import Signal, QPoint, QRectF, Qt
-from PySide6.QtGui import QColor, QPainter, QPen, QMouseEvent
+from PySide6.QtGui import QColor, QPainter, QPen, QMouseEvent, QImage, QLinearGradient
 from PySide6.QtWidgets import QWidget
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def hue_ring_image(radius, thickness, dpr):
+    size = 2 * radius + thickness + 2
+    image = QImage(round(size * dpr), round(size * dpr), QImage.Format.Format_ARGB32_Premultiplied)
+    image.setDevicePixelRatio(dpr)
+    image.fill(Qt.GlobalColor.transparent)
+
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    rect = QRectF(size / 2 - radius, size / 2 - radius, radius * 2, radius * 2)
+    for angle in range(360):
+        painter.setPen(QPen(QColor.fromHsv(angle, 255, 255), thickness))
+        painter.drawArc(rect, angle * 16, 16)
+    painter.end()
+    return image
+
+
+def sv_square_image(hue, size, dpr):
+    n = max(1, round(size * dpr))
+
+    if np is None:
+        # white to hue across, then darkened towards black downwards, which is the same HSV square
+        image = QImage(n, n, QImage.Format.Format_RGB32)
+        painter = QPainter(image)
+        across = QLinearGradient(0.5, 0, n + 0.5, 0)
+        across.setColorAt(0, Qt.GlobalColor.white)
+        across.setColorAt(1, QColor.fromHsv(hue, 255, 255))
+        painter.fillRect(image.rect(), across)
+        down = QLinearGradient(0, 0.5, 0, n + 0.5)
+        down.setColorAt(0, QColor(0, 0, 0, 0))
+        down.setColorAt(1, QColor(0, 0, 0, 255))
+        painter.fillRect(image.rect(), down)
+        painter.end()
+    else:
+        # with the hue fixed every channel is v * (1 - s * (1 - channel of the pure hue))
+        steps = np.arange(n) / n
+        s = np.floor(steps * 255) / 255
+        v = np.floor((1 - steps) * 255) / 255
+        pure = np.array(QColor.fromHsv(hue, 255, 255).getRgb()[:3]) / 255
+        rgb = np.rint(v[:, None, None] * (1 - s[None, :, None] * (1 - pure)) * 255).astype(np.uint32)
+        argb = np.ascontiguousarray(0xFF000000 | rgb[..., 0] << 16 | rgb[..., 1] << 8 | rgb[..., 2])
+        image = QImage(argb.data, n, n, n * 4, QImage.Format.Format_RGB32).copy()
+
+    image.setDevicePixelRatio(dpr)
+    return image
+
 
 class ColorWheel(QWidget):
     color_changed = Signal(QColor)
@@ -20,6 +71,12 @@ class ColorWheel(QWidget):
 
         self.is_hue_wheel = None
 
+        # the ring only depends on the size and the square only on the hue, so both are drawn once and blitted
+        self.ring_image = None
+        self.ring_key = None
+        self.sv_image = None
+        self.sv_key = None
+
     def get_color(self):
         return QColor.fromHsv(self.hue, int(self.saturation * 255), int(self.value * 255))
 
@@ -47,23 +104,23 @@ class ColorWheel(QWidget):
         self.radius = min(self.width(), self.height()) // 2 - 10
         center = QPoint(self.width() // 2, self.height() // 2)
 
+        dpr = self.devicePixelRatioF()
+
         # ring
-        for angle in range(360):
-            color = QColor.fromHsv(angle, 255, 255)
-            painter.setPen(QPen(color, self.thickness))
-            painter.drawArc(QRectF(center.x() - self.radius, center.y() - self.radius,
-                                   self.radius * 2, self.radius * 2), angle * 16, 16)
+        if self.ring_key != (self.radius, self.thickness, dpr):
+            self.ring_key = (self.radius, self.thickness, dpr)
+            self.ring_image = hue_ring_image(self.radius, self.thickness, dpr)
+        ring_size = self.ring_image.deviceIndependentSize()
+        painter.drawImage(QRectF(center.x() - ring_size.width() / 2, center.y() - ring_size.height() / 2,
+                                 ring_size.width(), ring_size.height()), self.ring_image)
 
         # square
         square_size = self.sq_size
         square_top_left = QPoint(center.x() - square_size // 2, center.y() - square_size // 2)
-        for x in range(int(square_size)):
-            for y in range(int(square_size)):
-                s = x / square_size
-                v = 1 - y / square_size
-                color = QColor.fromHsv(self.hue, int(s * 255), int(v * 255))
-                painter.setPen(color)
-                painter.drawPoint(square_top_left + QPoint(x, y))
+        if self.sv_key != (self.hue, square_size, dpr):
+            self.sv_key = (self.hue, square_size, dpr)
+            self.sv_image = sv_square_image(self.hue, square_size, dpr)
+        painter.drawImage(square_top_left, self.sv_image)
 
         painter.setPen(QPen(Qt.GlobalColor.white, 2))
         painter.setBrush(Qt.BrushStyle.NoBrush)
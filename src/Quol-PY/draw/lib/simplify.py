@@ -0,0 +1,36 @@
+from array import array
+
+from lib.stroke_index import segment_distance
+
+
+def simplify(coords: array, tolerance: float) -> array:
+    """Ramer-Douglas-Peucker over flat x, y pairs, iterative so long strokes can't hit the recursion limit."""
+    n = len(coords) // 2
+    if n < 3 or tolerance <= 0:
+        return array('i', coords)
+
+    keep = bytearray(n)
+    keep[0] = keep[-1] = 1
+    stack = [(0, n - 1)]
+
+    while stack:
+        first, last = stack.pop()
+        ax, ay, bx, by = coords[2 * first], coords[2 * first + 1], coords[2 * last], coords[2 * last + 1]
+
+        index, distance = 0, tolerance
+        for i in range(first + 1, last):
+            d = segment_distance(coords[2 * i], coords[2 * i + 1], ax, ay, bx, by)
+            if d > distance:
+                index, distance = i, d
+
+        if index:
+            keep[index] = 1
+            stack.append((first, index))
+            stack.append((index, last))
+
+    result = array('i')
+    for i in range(n):
+        if keep[i]:
+            result.append(coords[2 * i])
+            result.append(coords[2 * i + 1])
+    return result
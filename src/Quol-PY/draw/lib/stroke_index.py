@@ -0,0 +1,115 @@
+import math
+
+
+def segment_distance(px, py, ax, ay, bx, by):
+    dx = bx - ax
+    dy = by - ay
+    length = dx * dx + dy * dy
+    if length:
+        t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length))
+        ax += t * dx
+        ay += t * dy
+    return math.hypot(px - ax, py - ay)
+
+
+class StrokeIndex:
+    """Uniform grid over stroke segments, so the eraser only tests strokes near the cursor."""
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.strokes = {}
+        self.counter = 0
+
+    def clear(self):
+        self.cells.clear()
+        self.strokes.clear()
+
+    def add(self, stroke):
+        self.remove(stroke)
+        coords = stroke.coords
+        if not coords:
+            return
+
+        pad = stroke.width / 2
+        xs, ys = coords[0::2], coords[1::2]
+        bounds = (min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad)
+
+        cells = set()
+        for i in range(self.segment_count(stroke)):
+            a, b = self.segment(stroke, i)
+            for cell in self.segment_cells(a, b, pad):
+                self.cells.setdefault(cell, {}).setdefault(stroke, []).append(i)
+                cells.add(cell)
+
+        # the counter keeps the paint order, so the topmost stroke is erased first
+        self.counter += 1
+        self.strokes[stroke] = (self.counter, bounds, cells)
+
+    @staticmethod
+    def segment_count(stroke):
+        # a single point is stored as a zero length segment
+        return max(1, len(stroke.coords) // 2 - 1)
+
+    @staticmethod
+    def segment(stroke, i):
+        coords = stroke.coords
+        if len(coords) < 4:
+            return (coords[0], coords[1]), (coords[0], coords[1])
+        return (coords[2 * i], coords[2 * i + 1]), (coords[2 * i + 2], coords[2 * i + 3])
+
+    def remove(self, stroke):
+        entry = self.strokes.pop(stroke, None)
+        if entry is None:
+            return
+        for cell in entry[2]:
+            bucket = self.cells[cell]
+            del bucket[stroke]
+            if not bucket:
+                del self.cells[cell]
+
+    def segment_cells(self, a, b, pad):
+        size = self.cell_size
+        x0, x1 = sorted((a[0], b[0]))
+        y0, y1 = sorted((a[1], b[1]))
+        cx0, cx1 = math.floor((x0 - pad) / size), math.floor((x1 + pad) / size)
+        cy0, cy1 = math.floor((y0 - pad) / size), math.floor((y1 + pad) / size)
+
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) <= 4:
+            return [(cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+
+        # long diagonal segments (snapped lines) only keep the cells they actually pass through
+        reach = size * 0.7072 + pad
+        return [
+            (cx, cy)
+            for cx in range(cx0, cx1 + 1)
+            for cy in range(cy0, cy1 + 1)
+            if segment_distance((cx + 0.5) * size, (cy + 0.5) * size, a[0], a[1], b[0], b[1]) <= reach
+        ]
+
+    def hits(self, x, y, radius):
+        size = self.cell_size
+        checked = set()
+        found = []
+
+        for cx in range(math.floor((x - radius) / size), math.floor((x + radius) / size) + 1):
+            for cy in range(math.floor((y - radius) / size), math.floor((y + radius) / size) + 1):
+                for stroke, indices in self.cells.get((cx, cy), {}).items():
+                    if stroke in found:
+                        continue
+
+                    bounds = self.strokes[stroke][1]
+                    if bounds[0] > x + radius or bounds[2] < x - radius or bounds[1] > y + radius or bounds[3] < y - radius:
+                        continue
+
+                    limit = radius + stroke.width / 2
+                    for i in indices:
+                        if (stroke, i) in checked:
+                            continue
+                        checked.add((stroke, i))
+                        (ax, ay), (bx, by) = self.segment(stroke, i)
+                        if segment_distance(x, y, ax, ay, bx, by) <= limit:
+                            found.append(stroke)
+                            break
+
+        return sorted(found, key=lambda s: self.strokes[s][0], reverse=True)
@@ -1,13 +1,16 @@
 import collections
+from array import array
 
 from PySide6.QtGui import QColor, QMouseEvent, QPainter, Qt, QPixmap, QPen, QShortcut, QKeySequence, QCursor, \
-    QPainterPath, QIcon
+    QPainterPath, QIcon, QFont, QFontMetrics
 from PySide6.QtWidgets import QPushButton, QHBoxLayout, QWidget, QApplication, QSlider, QLabel, QVBoxLayout, QLineEdit
-from PySide6.QtCore import QPoint, Signal
+from PySide6.QtCore import QPoint, QRect, QRectF, Signal
 
 from qlib.windows.quol_window import QuolMainWindow
 from qlib.windows.tool_loader import ToolSpec
 from lib.color_wheel import ColorWheel
+from lib.simplify import simplify
+from lib.stroke_index import StrokeIndex
 
 
 class MainWindow(QuolMainWindow):
@@ -16,7 +19,7 @@ class MainWindow(QuolMainWindow):
     def __init__(self, tool_spec: ToolSpec):
         super().__init__('Draw', tool_spec, default_geometry=(360, 10, 190, 1))
 
-        self.drawing_widget = DrawingWidget()
+        self.drawing_widget = DrawingWidget(self.config['simplify_tolerance'])
 
         self.top_layout = QHBoxLayout()
         self.layout.addLayout(self.top_layout)
@@ -92,6 +95,7 @@ class MainWindow(QuolMainWindow):
         self.color_wheel.set_color(color)
 
     def on_update_config(self):
+        self.drawing_widget.tolerance = self.config['simplify_tolerance']
         self.tool_spec.input_manager.remove_hotkey(self.toggle_id)
         self.toggle_id = self.tool_spec.input_manager.add_hotkey(self.config['draw_toggle'], lambda: self.toggle.emit(), suppressed=True)
 
@@ -117,7 +121,7 @@ class MainWindow(QuolMainWindow):
 
 
 class DrawingWidget(QWidget):
-    def __init__(self):
+    def __init__(self, tolerance=0.0):
         super().__init__()
 
         self.setAttribute(Qt.WidgetAttribute.WA_StaticContents)
@@ -129,6 +133,7 @@ class DrawingWidget(QWidget):
         self.last_point = QPoint()
         self.pen_color = QColor('red')
         self.pen_width = 2
+        self.tolerance = tolerance
 
         self.undo_stack: [tuple[LineStroke, str]] = collections.deque(maxlen=30)
 
@@ -140,7 +145,14 @@ class DrawingWidget(QWidget):
         self.screenshot = QPixmap()
         self.setCursor(QCursor(Qt.CursorShape.CrossCursor))
 
+        # screenshot with every committed stroke flattened in, only the live stroke and cursor are drawn per paint
+        self.canvas = QPixmap()
+        self.overlay_rect = QRect()
+        self.coords_font = QFont(self.font())
+        self.coords_font.setPointSize(8)
+
         self.strokes: list[LineStroke] = []
+        self.stroke_index = StrokeIndex()
         self.current_stroke = None
         self.eraser_mode = False
         self.eraser_multiplier = 3
@@ -150,55 +162,120 @@ class DrawingWidget(QWidget):
         point = event.position().toPoint()
 
         if event.button() == Qt.MouseButton.LeftButton:
-            self.strokes.append(LineStroke(self.pen_color, self.pen_width))
+            self.strokes.append(LineStroke(self.pen_color, self.pen_width, self.tolerance))
             self.strokes[-1].add_point(point)
             self.current_stroke = self.strokes[-1]
             self.undo_stack.append((self.current_stroke, 'add'))
-            self.update()
+            self.update(self.current_stroke.rect())
 
         elif event.buttons() == Qt.MouseButton.RightButton:
             self.eraser_mode = True
             self.erase_stroke_at(point)
             self.setCursor(QCursor(Qt.CursorShape.BlankCursor))
-            self.update()
+
+        self.update_overlay(point)
 
     def mouseMoveEvent(self, event: QMouseEvent):
         point = event.position().toPoint()
 
         if event.buttons() & Qt.MouseButton.LeftButton and self.current_stroke:
-            if self.is_ctrl_pressed:
-                self.current_stroke.type = 'snap'
+            stroke = self.current_stroke
+            stroke_type = 'snap' if self.is_ctrl_pressed else 'free'
+
+            if stroke.type == stroke_type == 'free':
+                # only the new segment changed
+                self.update(QRect(stroke.last(), point).normalized().adjusted(*stroke.padding()))
+                stroke.add_point(point)
             else:
-                self.current_stroke.type = 'free'
-            self.current_stroke.add_point(point)
+                # a snapped line moves as a whole, and switching to snap drops the freehand points
+                dirty = stroke.rect()
+                stroke.type = stroke_type
+                stroke.add_point(point)
+                self.update(dirty.united(stroke.rect()))
 
         elif event.buttons() & Qt.MouseButton.RightButton:
             self.erase_stroke_at(point)
 
-        self.update()
+        self.update_overlay(point)
 
     def mouseReleaseEvent(self, event: QMouseEvent):
         if self.current_stroke:
-            self.current_stroke.to_free()
+            self.current_stroke.finish()
+            if event.button() == Qt.MouseButton.LeftButton:
+                self.commit_stroke(self.current_stroke)
+                self.current_stroke = None
 
         if event.button() == Qt.MouseButton.RightButton:
             self.eraser_mode = False
             self.current_stroke = None
             self.setCursor(QCursor(Qt.CursorShape.CrossCursor))
-            self.update()
+            self.update_overlay(event.position().toPoint())
 
     def paintEvent(self, event):
+        if self.canvas.isNull() or self.canvas.deviceIndependentSize().toSize() != self.size():
+            self.redraw_canvas()
+
         painter = QPainter(self)
-        painter.drawPixmap(self.rect(), self.screenshot)
+        dirty = event.rect()
+        dpr = self.canvas.devicePixelRatio()
+        painter.drawPixmap(
+            QRectF(dirty), self.canvas,
+            QRectF(dirty.x() * dpr, dirty.y() * dpr, dirty.width() * dpr, dirty.height() * dpr)
+        )
 
-        for stroke in self.strokes:
-            stroke.draw(painter)
+        if self.current_stroke:
+            self.current_stroke.draw(painter)
 
         if self.eraser_mode:
             self.draw_eraser_indicator(painter)
         else:
             self.draw_cursor_coordinates(painter)
 
+    def redraw_canvas(self, rect=None):
+        if self.canvas.isNull() or self.canvas.deviceIndependentSize().toSize() != self.size():
+            dpr = self.devicePixelRatioF()
+            self.canvas = QPixmap(round(self.width() * dpr), round(self.height() * dpr))
+            self.canvas.setDevicePixelRatio(dpr)
+            rect = None
+
+        rect = rect.intersected(self.rect()) if rect else self.rect()
+        painter = QPainter(self.canvas)
+        painter.setClipRect(rect)
+        if self.screenshot.isNull():
+            painter.fillRect(rect, Qt.GlobalColor.black)
+        else:
+            painter.drawPixmap(self.rect(), self.screenshot)
+
+        for stroke in self.strokes:
+            if stroke is not self.current_stroke and stroke.rect().intersects(rect):
+                stroke.draw(painter)
+        painter.end()
+
+        self.update(rect)
+
+    def commit_stroke(self, stroke):
+        self.stroke_index.add(stroke)
+        if self.canvas.isNull():
+            return
+        painter = QPainter(self.canvas)
+        stroke.draw(painter)
+        painter.end()
+        self.update(stroke.rect())
+
+    def overlay_rect_at(self, pos: QPoint) -> QRect:
+        if self.eraser_mode:
+            r = int((3 + self.pen_width ** 0.8) * self.eraser_multiplier) + 3
+            return QRect(pos.x() - r, pos.y() - r, 2 * r + 1, 2 * r + 1)
+
+        text = f"({pos.x()}, {pos.y()})"
+        return QFontMetrics(self.coords_font).boundingRect(text).translated(pos + QPoint(10, -10)).adjusted(-2, -2, 2, 2)
+
+    def update_overlay(self, pos: QPoint):
+        # the cursor overlays move on every mouse event, so only their old and new areas are repainted
+        rect = self.overlay_rect_at(pos)
+        self.update(self.overlay_rect.united(rect))
+        self.overlay_rect = rect
+
     def keyPressEvent(self, event):
         if event.key() == Qt.Key.Key_Control:
             self.is_ctrl_pressed = True
@@ -219,34 +296,39 @@ class DrawingWidget(QWidget):
         painter.drawPath(path)
 
     def erase_stroke_at(self, pos: QPoint):
-        for i in reversed(range(len(self.strokes))):
-            stroke = self.strokes[i]
-            for p in stroke.points:
-                t = stroke.width / 2 + (3 + self.pen_width ** 0.8) * self.eraser_multiplier
-                dx = p.x() - pos.x()
-                dy = p.y() - pos.y()
-                distance = (dx * dx + dy * dy) ** 0.5
-                if distance <= t:
-                    self.undo_stack.append((self.strokes.pop(i), 'remove'))
-                    break
-        self.update()
+        dirty = QRect()
+        for stroke in self.stroke_index.hits(pos.x(), pos.y(), (3 + self.pen_width ** 0.8) * self.eraser_multiplier):
+            self.strokes.remove(stroke)
+            self.stroke_index.remove(stroke)
+            self.undo_stack.append((stroke, 'remove'))
+            dirty = dirty.united(stroke.rect())
+
+        if not dirty.isNull():
+            self.redraw_canvas(dirty)
 
     def set_pen_color(self, color: QColor):
         self.pen_color = color
-        self.update()
 
     def clear_canvas(self):
         self.strokes.clear()
-        self.update()
+        self.stroke_index.clear()
+        self.current_stroke = None
+        self.redraw_canvas()
 
     def undo(self):
         if self.undo_stack:
             stroke, action = self.undo_stack.pop()
             if action == 'add':
                 self.strokes.remove(stroke)
+                self.stroke_index.remove(stroke)
+                if stroke is self.current_stroke:
+                    self.current_stroke = None
+                    self.update(stroke.rect())
+                else:
+                    self.redraw_canvas(stroke.rect())
             elif action == 'remove':
                 self.strokes.append(stroke)
-            self.update()
+                self.commit_stroke(stroke)
 
     def start_drawing(self, context):
         screen = QApplication.primaryScreen()
@@ -257,7 +339,7 @@ class DrawingWidget(QWidget):
         self.screenshot = screen.grabWindow(0, g2.x(), g2.y(), g2.width(), g2.height())
         context.toggle_instant_signal.emit(True)
 
-        self.update()
+        self.redraw_canvas()
         self.show()
 
     def stop_drawing(self):
@@ -265,7 +347,7 @@ class DrawingWidget(QWidget):
 
     def set_pen_width(self, width: int):
         self.pen_width = width
-        self.update()
+        self.update_overlay(self.mapFromGlobal(QCursor.pos()))
 
     def draw_cursor_coordinates(self, painter: QPainter):
         pos = self.mapFromGlobal(QCursor.pos())
@@ -273,9 +355,7 @@ class DrawingWidget(QWidget):
 
         painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Difference)
 
-        font = painter.font()
-        font.setPointSize(8)
-        painter.setFont(font)
+        painter.setFont(self.coords_font)
 
         painter.setPen(QColor(255, 255, 255))
         painter.drawText(pos + QPoint(10, -10), text)
@@ -297,49 +377,89 @@ class DrawingWidget(QWidget):
 
 
 class LineStroke:
-    def __init__(self, color, width):
-        self.points = []
+    def __init__(self, color, width, tolerance=0.0):
+        # flat x, y pairs, a few bytes per point instead of a QPoint object each
+        self.coords = array('i')
         self.color = color
         self.width = width
+        self.tolerance = tolerance
         self.type = 'point'
+        self.bounds = QRect()
+        self.path = QPainterPath()
+        self.pen = QPen(color, width, Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
+        self.pending = None
+
+    def __len__(self):
+        return len(self.coords) // 2
+
+    def first(self) -> QPoint:
+        return QPoint(self.coords[0], self.coords[1])
+
+    def last(self) -> QPoint:
+        return QPoint(self.coords[-2], self.coords[-1])
 
     def add_point(self, point):
-        while self.type == 'snap' and len(self.points) >= 2:
-            self.points.pop()
-        self.points.append(point)
+        x, y = point.x(), point.y()
+
+        if self.type == 'snap' and len(self) >= 2:
+            del self.coords[2:]
+            self.bounds = QRect(self.first(), self.first())
+            self.path = QPainterPath(self.first())
+        elif self.coords and self.tolerance and (x - self.coords[-2]) ** 2 + (y - self.coords[-1]) ** 2 < self.tolerance ** 2:
+            # too close to the last kept point to matter, kept aside in case the stroke ends here
+            self.pending = point
+            return
+
+        self.pending = None
+        self.coords.append(x)
+        self.coords.append(y)
+        if len(self) == 1:
+            self.bounds = QRect(point, point)
+            self.path = QPainterPath(point)
+        else:
+            self.bounds = self.bounds.united(QRect(point, point))
+            self.path.lineTo(point)
+
+    def padding(self):
+        pad = int(self.width / 2) + 2
+        return -pad, -pad, pad, pad
+
+    def rect(self) -> QRect:
+        return self.bounds.adjusted(*self.padding()) if self.coords else QRect()
+
+    def xy(self):
+        it = iter(self.coords)
+        return zip(it, it)
 
     def to_free(self):
+        # a snapped line stays two points, the eraser hit-tests segments so it needs no filler points
         if self.type == 'snap':
             self.type = 'free'
-        else:
-            return
 
-        d = self.points[0] - self.points[-1]
-        d = int((d.x() ** 2 + d.y() ** 2) ** 0.5 // 10)
+    def finish(self):
+        self.to_free()
+        if self.pending is not None and len(self) > 1:
+            self.coords.append(self.pending.x())
+            self.coords.append(self.pending.y())
+            self.bounds = self.bounds.united(QRect(self.pending, self.pending))
+        self.pending = None
 
-        for i in range(d):
-            t = (i + 1) / (d + 1)
-            x = int(self.points[0].x() * (1 - t) + self.points[-1].x() * t)
-            y = int(self.points[0].y() * (1 - t) + self.points[-1].y() * t)
-            self.points.insert(-1, QPoint(x, y))
+        if len(self) > 2 and self.tolerance:
+            self.coords = simplify(self.coords, self.tolerance)
+            self.path = QPainterPath(self.first())
+            for x, y in list(self.xy())[1:]:
+                self.path.lineTo(x, y)
 
     def draw(self, painter):
-        if not self.points:
+        if not self.coords:
             return
 
-        if len(self.points) == 1:
+        if len(self) == 1:
             painter.setBrush(self.color)
             painter.setPen(Qt.PenStyle.NoPen)
-            painter.drawEllipse(self.points[0], self.width / 2, self.width / 2)
+            painter.drawEllipse(self.first(), self.width / 2, self.width / 2)
             painter.setBrush(Qt.BrushStyle.NoBrush)
             return
 
-        path = QPainterPath()
-        pen = QPen(self.color, self.width, Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
-        painter.setPen(pen)
-        path.moveTo(self.points[0])
-
-        for pt in self.points[1:]:
-            path.lineTo(pt)
-
-        painter.drawPath(path)
+        painter.setPen(self.pen)
+        painter.drawPath(self.path)